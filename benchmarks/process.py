@@ -0,0 +1,345 @@
+"""Benchmarks for the `tea.process` module.
+
+Run from the repository root::
+
+    python benchmarks/process.py
+
+Results can be saved as JSON and compared with the results of another
+version::
+
+    python benchmarks/process.py --json before.json
+    python benchmarks/process.py --json after.json --compare before.json
+
+All timings are in seconds.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import datetime
+import statistics
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tea.version import __version__  # noqa: E402
+from tea.process import (  # noqa: E402
+    Process,
+    ProcessTable,
+    WorkerPool,
+    execute,
+    find,
+    get_processes,
+)
+from tea.process.process import _create_env  # noqa: E402
+
+
+def measure(func, repeat=100, warmup=5):
+    """Call `func` `repeat` times and return the timings in seconds."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# Largest output size of `capture_size`, 1 GiB by default.
+CAPTURE_MAX_SIZE = 1024 ** 3
+
+# Number of extra processes started for the process listing benchmarks.
+LISTING_PROCESSES = 500
+
+
+def summarize(timings):
+    """Summary statistics of a list of timings."""
+    timings = sorted(timings)
+    return {
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "p95": timings[math.ceil(len(timings) * 0.95) - 1],
+        "mean": statistics.mean(timings),
+        "repeat": len(timings),
+    }
+
+
+def report(name, timings):
+    summary = summarize(timings)
+    print(
+        f"{name:<40} "
+        f"min={summary['min'] * 1000:10.3f}ms "
+        f"median={summary['median'] * 1000:10.3f}ms "
+        f"p95={summary['p95'] * 1000:10.3f}ms"
+    )
+
+
+def bench_execute_true():
+    """Latency of `execute(["true"])`, spawn to collected output."""
+    return measure(lambda: execute(["true"]))
+
+
+def bench_execute_concurrent():
+    """Wall time of 64 `execute(["true"])` calls from a pool of threads."""
+    results = {}
+    for threads in (1, 8, 32):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+
+            def batch():
+                list(executor.map(lambda _: execute(["true"]), range(64)))
+
+            results[f"threads={threads}"] = measure(batch, 10, warmup=1)
+    return results
+
+
+def _size_label(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size}{unit}"
+        size //= 1024
+
+
+def bench_capture_size():
+    """Run a process writing 1 KiB to 1 GiB and read all of its output."""
+    results = {}
+    size = 1024
+    while size <= CAPTURE_MAX_SIZE:
+        command = ["head", "-c", str(size), "/dev/zero"]
+        # Fewer repetitions for the large outputs.
+        repeat = max(1, min(20, 2 ** 26 // size))
+        for capture in ("file", "pipe"):
+            kwargs = {"capture": capture}
+            if capture == "pipe":
+                kwargs["capture_spill"] = 64 * 1024 ** 2
+
+            def run():
+                p = Process(command, **kwargs)
+                p.start()
+                p.wait()
+                assert len(p.read_bytes()) == size
+
+            label = f"{capture}[{_size_label(size)}]"
+            results[label] = measure(run, repeat, warmup=min(repeat, 2) - 1)
+        size *= 32
+    return results
+
+
+@contextlib.contextmanager
+def large_environment(size=2000):
+    for i in range(size):
+        os.environ[f"TEA_BENCH_{i}"] = "x" * 64
+    try:
+        yield
+    finally:
+        for i in range(size):
+            del os.environ[f"TEA_BENCH_{i}"]
+
+
+def bench_create_env():
+    """Environment creation overhead with 2000 variables and an override."""
+    with large_environment():
+        return measure(lambda: _create_env({"TEA_BENCH": "1"}), repeat=1000)
+
+
+def bench_create_env_uncached():
+    """Same as `create_env` rebuilding the environment on every call."""
+
+    def create_env(env):
+        full_env = {str(k): str(v) for k, v in os.environ.items()}
+        full_env.update({str(k): str(v) for k, v in env.items()})
+        return full_env
+
+    with large_environment():
+        return measure(lambda: create_env({"TEA_BENCH": "1"}), repeat=1000)
+
+
+def bench_spawn_rss():
+    """Spawn latency of every strategy as the parent's RSS grows."""
+    results = {}
+    ballast = []
+    for size in (0, 256, 1024):
+        # Touch every page so the memory is actually resident.
+        missing = size * 1024 * 1024 - sum(map(len, ballast))
+        ballast.append(bytearray(b"x") * missing)
+        for spawn in ("posix_spawn", "fork"):
+
+            def start():
+                p = Process(["true"], redirect_output=False, spawn=spawn)
+                p.start()
+                p.wait()
+
+            results[f"{spawn}[rss+{size}MiB]"] = measure(start)
+    return results
+
+
+def bench_python_pool():
+    """Short Python command in a fresh interpreter and in a warm worker."""
+    code = "import json; print(json.dumps([1, 2, 3]))"
+    results = {
+        "cold": measure(lambda: execute([sys.executable, "-c", code]), 20)
+    }
+    with WorkerPool(processes=1, preload=["json"]) as pool:
+        results["warm"] = measure(lambda: pool.execute_code(code))
+    return results
+
+
+def bench_stdin_feed():
+    """Feed 100k short lines to `cat` line by line and batched."""
+    lines = [f"record {i}" for i in range(100000)]
+
+    def feed(batched):
+        p = Process(["cat"], capture="pipe", capture_limit=1024)
+        p.start()
+        if batched:
+            p.writelines(lines)
+        else:
+            for line in lines:
+                p.write(line)
+        p.close_stdin()
+        p.wait()
+
+    def feed_bytes():
+        p = Process(["cat"], capture="pipe", capture_limit=1024)
+        p.start()
+        p.feed_from(chunk for _ in range(64))
+        p.close_stdin()
+        p.wait()
+
+    chunk = b"x" * 1024 ** 2
+    return {
+        "write": measure(lambda: feed(False), repeat=5, warmup=1),
+        "writelines": measure(lambda: feed(True), repeat=5, warmup=1),
+        "feed_from[64MiB]": measure(feed_bytes, repeat=5, warmup=1),
+    }
+
+
+def bench_process_listing():
+    """Process listing and lookup with `LISTING_PROCESSES` extra processes."""
+    processes = []
+    try:
+        for _ in range(LISTING_PROCESSES):
+            p = Process(["sleep", "600"], redirect_output=False)
+            p.start()
+            processes.append(p)
+        table = ProcessTable()
+        table.refresh()
+
+        def table_find():
+            table.refresh()
+            table.find("sleep", "no-such-argument")
+
+        return {
+            f"get_processes[+{LISTING_PROCESSES}]": measure(
+                get_processes, repeat=10, warmup=1
+            ),
+            f"find[+{LISTING_PROCESSES}]": measure(
+                lambda: find("sleep", "no-such-argument"), repeat=10, warmup=1
+            ),
+            f"table_find[+{LISTING_PROCESSES}]": measure(
+                table_find, repeat=10, warmup=1
+            ),
+        }
+    finally:
+        for p in processes:
+            p.kill()
+
+
+BENCHMARKS = [
+    bench_execute_true,
+    bench_execute_concurrent,
+    bench_capture_size,
+    bench_create_env,
+    bench_create_env_uncached,
+    bench_spawn_rss,
+    bench_python_pool,
+    bench_stdin_feed,
+    bench_process_listing,
+]
+
+
+def metadata():
+    """Description of the environment the benchmarks ran in."""
+    return {
+        "tea": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def compare(results, baseline):
+    """Print the median of every result relative to the baseline."""
+    print()
+    print(f"Compared with tea {baseline['meta']['tea']}:")
+    for name, summary in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = summary["median"] / before["median"]
+        print(
+            f"{name:<40} "
+            f"{before['median'] * 1000:10.3f}ms -> "
+            f"{summary['median'] * 1000:10.3f}ms ({ratio:6.2f}x)"
+        )
+
+
+def main():
+    global CAPTURE_MAX_SIZE, LISTING_PROCESSES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-k",
+        "--filter",
+        help="Only run the benchmarks whose name contains this string.",
+    )
+    parser.add_argument("--json", help="Write the results to a JSON file.")
+    parser.add_argument(
+        "--compare", help="Compare the results with a saved JSON file."
+    )
+    parser.add_argument(
+        "--capture-max-size",
+        type=int,
+        default=CAPTURE_MAX_SIZE,
+        help="Largest output size in bytes for `capture_size`.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=LISTING_PROCESSES,
+        help="Number of extra processes for `process_listing`.",
+    )
+    args = parser.parse_args()
+    CAPTURE_MAX_SIZE = args.capture_max_size
+    LISTING_PROCESSES = args.processes
+
+    results = {}
+    for bench in BENCHMARKS:
+        name = bench.__name__[len("bench_") :]
+        if args.filter and args.filter not in name:
+            continue
+        timings = bench()
+        if not isinstance(timings, dict):
+            timings = {None: timings}
+        for label, values in timings.items():
+            full_name = name if label is None else f"{name}.{label}"
+            report(full_name, values)
+            results[full_name] = summarize(values)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
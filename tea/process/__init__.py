@@ -1,19 +1,45 @@
 __all__ = [
     "Process",
+    "AsyncProcess",
     "ExecutableNotFound",
+    "ProcessTimeout",
+    "ResourceUsage",
     "kill",
+    "ProcessInfo",
+    "ResultCache",
+    "ProcessTable",
+    "Monitor",
+    "WorkerPool",
+    "Pipeline",
     "find",
     "get_processes",
     "execute",
     "execute_no_demux",
+    "execute_pipeline",
+    "execute_many",
     "execute_and_report",
 ]
 
-from tea.process.process import Process, ExecutableNotFound, kill
+from tea.process.process import (
+    Process,
+    ExecutableNotFound,
+    ProcessTimeout,
+    ResourceUsage,
+    kill,
+)
+from tea.process.aio import AsyncProcess
 from tea.process.wrappers import (
+    ProcessInfo,
+    ResultCache,
     find,
     get_processes,
     execute,
     execute_no_demux,
+    execute_pipeline,
+    execute_many,
     execute_and_report,
 )
+from tea.process.table import ProcessTable
+from tea.process.monitor import Monitor
+from tea.process.pool import WorkerPool
+from tea.process.pipeline import Pipeline
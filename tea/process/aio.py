@@ -0,0 +1,393 @@
+"""Asyncio counterpart of the :class:`tea.process.Process` class.
+
+Subprocesses are created with :func:`asyncio.create_subprocess_exec`, so the
+event loop's child watcher is notified about their termination and no threads
+are created per process.
+"""
+
+import os
+import codecs
+import asyncio
+import logging
+import subprocess
+from typing import Optional, Dict, Union, List, Tuple, AsyncGenerator
+
+from tea.process.capture import CHUNK_SIZE
+from tea.process.process import (
+    ProcessError,
+    ExecutableNotFound,
+    kill,
+    _create_env,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class _PipeBuffer:
+    """Buffer that is filled from the read end of a pipe by the event loop.
+
+    The pipe is read directly instead of through an asyncio stream, so the
+    output that is already in it can be drained when the process exits,
+    without waiting for descendants that inherited the write end.
+    """
+
+    def __init__(self, fd: int):
+        os.set_blocking(fd, False)
+        self._fd = fd
+        self._data = bytearray()
+        self._position = 0
+        self._eof = False
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_event_loop()
+        self._loop.add_reader(fd, self._read)
+
+    def _read(self) -> bool:
+        # Returns `True` if there might be more data in the pipe.
+        try:
+            chunk = os.read(self._fd, CHUNK_SIZE)
+        except BlockingIOError:
+            return False
+        if not chunk:
+            self._close()
+            return False
+        self._data += chunk
+        self._changed.set()
+        return True
+
+    def _close(self):
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._eof = True
+        self._changed.set()
+
+    def drain(self):
+        """Read everything that is in the pipe now."""
+        while not self._eof and self._read():
+            pass
+
+    def read(self) -> bytes:
+        data = bytes(self._data[self._position :])
+        self._position = len(self._data)
+        return data
+
+    async def iter_chunks(self) -> AsyncGenerator[bytes, None]:
+        while True:
+            chunk = self.read()
+            if chunk:
+                yield chunk
+            elif self._eof:
+                return
+            else:
+                self._changed.clear()
+                await self._changed.wait()
+
+
+class AsyncProcess:
+    r"""Asyncio process class.
+
+    Usage::
+
+        >>> from tea.process import AsyncProcess
+        >>> p = AsyncProcess(['python', '-c', 'print(3)'])
+        >>> await p.start()
+        >>> await p.wait()
+        True
+        >>> await p.read()
+        '3\\n'
+    """
+
+    def __init__(
+        self,
+        command: Union[str, List[str]],
+        env: Optional[Dict[str, str]] = None,
+        demux: bool = True,
+        redirect_output: bool = True,
+        working_dir: Optional[str] = None,
+        encoding: str = "utf-8",
+    ):
+        """Create an AsyncProcess object.
+
+        The constructor only initializes the class. To actually execute the
+        process you have to await the `start` method.
+
+        Args:
+            command: Path to the executable file or a list with the full
+                command and it's arguments.
+            env: Optional additional environment variables that will be added
+                to the subprocess environment or that override currently set
+                environment variables.
+            demux: Demux stdout and stderr. Default: `True`. If demux is set to
+                `False` `eread` will always return an empty string and all
+                stderr will be redirected to stdout.
+            redirect_output: `True` if you want to be able to get the standard
+                output and the standard error of the subprocess, otherwise it
+                will be redirected to /dev/null.
+            working_dir: Set the working directory from which the process will
+                be started.
+            encoding: Encoding to use to decode the standard output and
+                standard error.
+        """
+        self._commandline = [command] if isinstance(command, str) else command
+        self._env = env
+        self._demux = demux
+        self._redirect_output = redirect_output
+        self._working_dir = working_dir
+        self._encoding = encoding
+        self._process = None
+        self._stdout = None
+        self._stderr = None
+        self._stdout_decoder = None
+        self._stderr_decoder = None
+        self._done = None
+
+    @property
+    def command(self):
+        """Command."""
+        return self._commandline[0]
+
+    @property
+    def arguments(self):
+        """Arguments."""
+        return self._commandline[1:]
+
+    @property
+    def command_line(self):
+        """Full command line."""
+        return self._commandline
+
+    async def start(self):
+        """Start the process."""
+        # Read ends of the output pipes, the write ends go to the child.
+        readers = []
+        if self._redirect_output:
+            stdin = subprocess.PIPE
+            readers.append(os.pipe())
+            stdout = readers[0][1]
+            if self._demux:
+                readers.append(os.pipe())
+                stderr = readers[1][1]
+            else:
+                stderr = subprocess.STDOUT
+        else:
+            stdin = None
+            stdout = subprocess.DEVNULL
+            stderr = subprocess.STDOUT
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                *self._commandline,
+                stdin=stdin,
+                stdout=stdout,
+                stderr=stderr,
+                env=_create_env(self._env),
+                cwd=self._working_dir,
+            )
+        except OSError:
+            for read_fd, _ in readers:
+                os.close(read_fd)
+            raise ExecutableNotFound(command=self.command)
+        finally:
+            for _, write_fd in readers:
+                os.close(write_fd)
+        if self._redirect_output:
+            decoder = codecs.getincrementaldecoder(self._encoding)
+            self._stdout = _PipeBuffer(readers[0][0])
+            self._stdout_decoder = decoder()
+            if self._demux:
+                self._stderr = _PipeBuffer(readers[1][0])
+                self._stderr_decoder = decoder()
+        self._done = asyncio.ensure_future(self.__wait())
+
+    async def __wait(self):
+        await self._process.wait()
+        if self._process.stdin is not None:
+            self._process.stdin.close()
+        # Everything the process wrote is in the pipes once it has exited.
+        # Descendants that inherited them, e.g. commands started in the
+        # background, don't delay the wait, their output is still read as
+        # long as they keep running.
+        for buffer in (self._stdout, self._stderr):
+            if buffer is not None:
+                buffer.drain()
+
+    async def kill(self):
+        """Kill the process if it's running."""
+        try:
+            if self._process is not None:
+                kill(self.pid)
+                await self._done
+                return True
+            return None
+        except OSError:
+            return False
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the process to finish.
+
+        The process has finished once it has exited and the output it wrote
+        has been read from the pipes. Descendants that inherited the pipes
+        don't delay it.
+
+        Args:
+            timeout: `None` if you want to wait until the process actually
+                finishes, otherwise it will wait just the `timeout` number of
+                seconds.
+
+        Returns:
+            bool: `True` if the process finished in the amount of time
+                specified, `False` otherwise.
+        """
+        if self._done is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._done), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @property
+    def is_running(self):
+        """Indicate if the process is still running."""
+        return self._done is not None and not self._done.done()
+
+    @property
+    def pid(self):
+        """PID of the process if it is running."""
+        return self._process.pid
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        """Exit code if the process has finished running."""
+        if self.is_running or self._process is None:
+            return None
+        return self._process.returncode
+
+    async def write(self, string: str):
+        """Write a string to the process standard input.
+
+        Args:
+            string: String to write to the process standard input.
+        """
+        if self._redirect_output:
+            if string[-1] != "\n":
+                string += "\n"
+            self._process.stdin.write(string.encode(self._encoding))
+            await self._process.stdin.drain()
+
+    async def read(self) -> str:
+        """Read from the process standard output.
+
+        Returns:
+            str: The data process has written to the standard output since
+                the last read.
+        """
+        if self._stdout is None:
+            return ""
+        return self.__decode(self._stdout.read(), self._stdout_decoder)
+
+    async def eread(self) -> str:
+        """Read from the process standard error.
+
+        Returns:
+            str: The data process has written to the standard error since
+                the last read.
+        """
+        if self._stderr is None:
+            return ""
+        return self.__decode(self._stderr.read(), self._stderr_decoder)
+
+    def __decode(self, data: bytes, decoder: codecs.IncrementalDecoder):
+        # Incremental decoders keep incomplete multi-byte characters between
+        # reads instead of failing on them.
+        return decoder.decode(data, final=not self.is_running)
+
+    async def iter_lines(
+        self, stderr: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """Asynchronously iterate over the output lines.
+
+        Lines keep their line endings, the last line may not have one. Lines
+        yielded here won't be returned by `read` or `eread` any more.
+
+        Args:
+            stderr: Iterate over the standard error instead of the standard
+                output.
+        """
+        buffer = self._stderr if stderr else self._stdout
+        if buffer is None:
+            raise ProcessError("Output is not redirected")
+        pending = b""
+        async for chunk in buffer.iter_chunks():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield (line + b"\n").decode(self._encoding)
+        if pending:
+            yield pending.decode(self._encoding)
+
+    def __aiter__(self):
+        return self.iter_lines()
+
+    def __str__(self):
+        pid = self._process.pid if self._process is not None else None
+        return f"AsyncProcess(pid={pid}, command={self.command})"
+
+    __repr__ = __str__
+
+
+async def execute(
+    command: Union[str, List[str]],
+    env: Optional[Dict[str, str]] = None,
+    working_dir: Optional[str] = None,
+    wait: bool = True,
+) -> Union[Tuple[int, str, str], AsyncProcess]:
+    """Execute a command with arguments and wait for output.
+
+    Asyncio version of :func:`tea.process.execute`.
+
+    Args:
+        command: Command to execute.
+        env: Environment variables.
+        working_dir: Set the working dir.
+        wait: Wait for the process to finish.
+
+    Returns:
+        Tuple[int, str, str]: (exit_code, stdout, stderr) if wait is `True`
+            else the process instance.
+    """
+    process = AsyncProcess(command=command, env=env, working_dir=working_dir)
+    await process.start()
+    if not wait:
+        return process
+    await process.wait()
+    return process.exit_code, await process.read(), await process.eread()
+
+
+async def execute_no_demux(
+    command: Union[str, List[str]],
+    env: Optional[Dict[str, str]] = None,
+    working_dir: Optional[str] = None,
+    wait: bool = True,
+) -> Union[Tuple[int, str], AsyncProcess]:
+    """Execute a command and return the exit code and output.
+
+    Asyncio version of :func:`tea.process.execute_no_demux`.
+
+    Args:
+        command: Command to execute.
+        env: Environment variables.
+        working_dir: Set the working dir.
+        wait: Wait for the process to finish.
+
+    Returns:
+        Tuple[int, str]: (exit_code, output) if wait is `True` else the
+            process instance.
+    """
+    process = AsyncProcess(
+        command=command, env=env, working_dir=working_dir, demux=False
+    )
+    await process.start()
+    if not wait:
+        return process
+    await process.wait()
+    return process.exit_code, await process.read()
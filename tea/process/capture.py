@@ -0,0 +1,348 @@
+"""Capture of process output read from OS pipes."""
+
+import os
+import codecs
+import logging
+import threading
+import collections
+from tempfile import TemporaryFile
+from typing import (
+    IO,
+    Callable,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PipeBuffer:
+    """File like buffer that is filled from a pipe.
+
+    Data is appended from the thread of the `Hub` and consumed with `read`
+    or by iterating over `iter_chunks`. Both share the same read position, so
+    data is returned only once, the same way as reading from a file.
+
+    By default all data is kept in memory. If `spill_size` is set, only the
+    first `spill_size` bytes are kept in memory and the rest is written to a
+    temporary file. If `max_size` is set, only the first and the last
+    `max_size / 2` bytes are kept, the bytes in between are dropped and
+    counted in `dropped`.
+
+    Args:
+        spill_size: Number of bytes kept in memory before spilling to disk.
+        max_size: Maximum number of bytes kept.
+    """
+
+    def __init__(
+        self, spill_size: Optional[int] = None, max_size: Optional[int] = None
+    ):
+        self._spill_size = spill_size
+        self._head_size = self._tail_size = None
+        if max_size is not None:
+            self._head_size = max_size // 2
+            self._tail_size = max_size - self._head_size
+        # Head of the stream: memory followed by the spill file.
+        self._memory = bytearray()
+        self._file = None
+        self._stored = 0
+        # Tail of the stream, only used when the size is limited.
+        self._tail = collections.deque()
+        self._tail_length = 0
+        self._tail_start = None
+        # Logical stream state.
+        self._written = 0
+        self._position = 0
+        self._eof = False
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def __store(self, data: memoryview):
+        if self._file is None:
+            if self._spill_size is not None:
+                keep = max(self._spill_size - len(self._memory), 0)
+            else:
+                keep = len(data)
+            self._memory += data[:keep]
+            data = data[keep:]
+            if data:
+                self._file = TemporaryFile()
+        if data:
+            self._file.write(data)
+            self._file.flush()
+        self._stored = len(self._memory) + (
+            self._file.tell() if self._file is not None else 0
+        )
+
+    def __append_tail(self, data: memoryview):
+        if self._tail_start is None:
+            self._tail_start = self._stored
+        self._tail.append(bytes(data))
+        self._tail_length += len(data)
+        excess = self._tail_length - self._tail_size
+        while excess > 0:
+            chunk = self._tail.popleft()
+            if len(chunk) > excess:
+                self._tail.appendleft(chunk[excess:])
+                dropped = excess
+            else:
+                dropped = len(chunk)
+            self._tail_length -= dropped
+            self._tail_start += dropped
+            excess -= dropped
+
+    def feed(self, data: bytes):
+        """Append data read from the pipe."""
+        data = memoryview(data)
+        with self._condition:
+            self._written += len(data)
+            if self._head_size is not None:
+                head = max(self._head_size - self._stored, 0)
+                if head:
+                    self.__store(data[:head])
+                if data[head:]:
+                    self.__append_tail(data[head:])
+            else:
+                self.__store(data)
+            self._condition.notify_all()
+
+    def finish(self):
+        """Mark the end of the stream."""
+        with self._condition:
+            self._eof = True
+            self._condition.notify_all()
+
+    @property
+    def eof(self) -> bool:
+        """`True` if the writing end of the pipe has been closed."""
+        return self._eof
+
+    @property
+    def dropped(self) -> int:
+        """Number of bytes dropped because of the `max_size` limit."""
+        if self._tail_start is None:
+            return 0
+        return self._tail_start - self._stored
+
+    @property
+    def spilled(self) -> bool:
+        """`True` if part of the data was spilled to a temporary file."""
+        return self._file is not None
+
+    def __read_stored(self, position: int, size: int) -> bytes:
+        data = b""
+        if position < len(self._memory):
+            data = bytes(self._memory[position : position + size])
+            position += len(data)
+            size -= len(data)
+        if size > 0 and self._file is not None:
+            data += os.pread(
+                self._file.fileno(), size, position - len(self._memory)
+            )
+        return data
+
+    def __read_tail(self, position: int, size: int) -> bytes:
+        offset = position - self._tail_start
+        parts = []
+        for chunk in self._tail:
+            if offset >= len(chunk):
+                offset -= len(chunk)
+                continue
+            part = chunk[offset : offset + size]
+            offset = 0
+            parts.append(part)
+            size -= len(part)
+            if size <= 0:
+                break
+        return b"".join(parts)
+
+    def __read_at(self, position: int, size: int = -1) -> Tuple[bytes, int]:
+        # Read at most `size` bytes starting at the logical `position`. Returns
+        # the data and the position after it, dropped bytes are skipped.
+        remaining = self._written if size < 0 else size
+        parts = []
+        if position < self._stored and remaining > 0:
+            part = self.__read_stored(position, remaining)
+            parts.append(part)
+            position += len(part)
+            remaining -= len(part)
+        if self._tail_start is not None:
+            position = max(position, self._tail_start)
+            if position < self._written and remaining > 0:
+                part = self.__read_tail(position, remaining)
+                parts.append(part)
+                position += len(part)
+        return b"".join(parts), position
+
+    def read(self, size: int = -1) -> bytes:
+        """Read at most `size` bytes that were not already read.
+
+        Never blocks. If size is negative all available data is returned.
+        Dropped bytes are skipped.
+        """
+        with self._condition:
+            data, self._position = self.__read_at(self._position, size)
+            return data
+
+    def readline(self) -> bytes:
+        """Read the next line including the line ending.
+
+        Never blocks. Returns an empty bytes object if there is no complete
+        line available yet, unless the stream has ended in which case the
+        last unterminated line is returned.
+        """
+        with self._condition:
+            parts = []
+            position = self._position
+            while True:
+                start = position
+                data, position = self.__read_at(start, CHUNK_SIZE)
+                if not data:
+                    if not self._eof:
+                        return b""
+                    break
+                index = data.find(b"\n")
+                if index != -1:
+                    data, position = self.__read_at(start, index + 1)
+                    parts.append(data)
+                    break
+                parts.append(data)
+            self._position = position
+            return b"".join(parts)
+
+    def read_since(self, offset: int) -> bytes:
+        """Read all available data starting at `offset`.
+
+        The offset is counted from the start of the stream, including dropped
+        bytes. It doesn't move the read position.
+        """
+        with self._condition:
+            return self.__read_at(offset)[0]
+
+    def iter_chunks(self) -> Generator[bytes, None, None]:
+        """Yield chunks of data as they arrive until the end of the stream."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._eof or self._position < self._written
+                )
+                chunk = self.read()
+            if chunk:
+                yield chunk
+            elif self._eof:
+                return
+
+    def close(self):
+        with self._condition:
+            if self._file is not None:
+                self._file.close()
+            self.closed = True
+
+
+class TextDispatcher:
+    """Decode a stream and pass it to a callback line by line or in chunks.
+
+    Args:
+        callback: Called with every decoded line, including the line ending,
+            or with every decoded chunk.
+        encoding: Encoding of the stream.
+        lines: Split the stream into lines, otherwise every chunk read from
+            the pipe is passed as is.
+    """
+
+    def __init__(
+        self, callback: Callable[[str], None], encoding: str, lines: bool
+    ):
+        self._callback = callback
+        self._decoder = codecs.getincrementaldecoder(encoding)(
+            errors="replace"
+        )
+        self._lines = lines
+        self._partial = ""
+
+    def __dispatch(self, text: str):
+        if not self._lines:
+            if text:
+                self._callback(text)
+            return
+        text = self._partial + text
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._callback(line + "\n")
+
+    def feed(self, data: bytes):
+        self.__dispatch(self._decoder.decode(data))
+
+    def finish(self):
+        self.__dispatch(self._decoder.decode(b"", final=True))
+        if self._partial:
+            self._callback(self._partial)
+            self._partial = ""
+
+
+class FileWriter:
+    """Write a stream to a binary file as it arrives."""
+
+    def __init__(self, file: IO[bytes]):
+        self._file = file
+
+    def feed(self, data: bytes):
+        self._file.write(data)
+
+    def finish(self):
+        self._file.flush()
+
+
+class Deferred:
+    """Pass a stream to a consumer through `submit` instead of directly.
+
+    Used to move consumers that run user code off the hub thread: `submit`
+    is called with the consumer's method and its arguments, and has to call
+    them in order.
+    """
+
+    def __init__(
+        self, consumer: Union[TextDispatcher, FileWriter], submit: Callable
+    ):
+        self._consumer = consumer
+        self._submit = submit
+
+    def feed(self, data: bytes):
+        self._submit(self._consumer.feed, data)
+
+    def finish(self):
+        self._submit(self._consumer.finish)
+
+
+Consumer = Union[PipeBuffer, TextDispatcher, FileWriter, Deferred]
+
+
+class Fanout:
+    """Pass every chunk read from a pipe to multiple consumers.
+
+    The chunk is passed to every consumer as is, so it's not copied. A
+    consumer that raises doesn't affect the others.
+    """
+
+    def __init__(self, consumers: List[Consumer]):
+        self._consumers = consumers
+
+    def __call(self, method: str, *args):
+        for consumer in self._consumers:
+            try:
+                getattr(consumer, method)(*args)
+            except Exception:
+                logger.exception("Output consumer %r failed.", consumer)
+
+    def feed(self, data: bytes):
+        self.__call("feed", data)
+
+    def finish(self):
+        self.__call("finish")
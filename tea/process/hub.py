@@ -0,0 +1,274 @@
+"""Process wide selector servicing child processes.
+
+A single background thread waits on one selector (epoll on Linux) for the
+output pipes of all children and, where pidfds are supported, for their exit
+notifications. The number of threads stays constant regardless of the number
+of running children.
+
+The hub thread never runs user code. Output callbacks, tees and future
+callbacks are passed to a `Strand`, which runs them in order on a shared pool
+of callback threads, so a callback that blocks can't stall other children.
+"""
+
+import os
+import logging
+import threading
+import selectors
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+from tea.dsa.singleton import Singleton
+from tea.process.capture import CHUNK_SIZE, Consumer, Fanout
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of callback threads shared by all strands.
+CALLBACK_THREADS = 32
+
+
+class Strand:
+    """Run callables one after another on the shared callback threads.
+
+    Callables submitted to the same strand run in submission order and never
+    concurrently, callables of different strands run in parallel.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._scheduled = False
+
+    def submit(self, func: Callable, *args):
+        """Schedule `func(*args)` after everything submitted before."""
+        with self._lock:
+            self._queue.append((func, args))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self.__run)
+
+    def __run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._scheduled = False
+                    return
+                func, args = self._queue.popleft()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Callback %r failed.", func)
+
+
+class _Child:
+    """Exit notification of a child tracked by its pidfd."""
+
+    __slots__ = ("callback",)
+
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+
+    def ready(self, hub: "Hub", key: selectors.SelectorKey):
+        hub._unregister(key.fileobj)
+        os.close(key.fd)
+        self.callback()
+
+
+class _PipeGroup:
+    """Pipes of one process, `on_done` is called when all reached EOF."""
+
+    __slots__ = ("remaining", "on_done")
+
+    def __init__(self, remaining: int, on_done: Optional[Callable[[], None]]):
+        self.remaining = remaining
+        self.on_done = on_done
+
+    def finished(self):
+        self.remaining -= 1
+        if self.remaining == 0 and self.on_done is not None:
+            self.on_done()
+
+
+class _Pipe:
+    """Readable end of a pipe drained into a consumer."""
+
+    __slots__ = ("consumer", "group")
+
+    def __init__(self, consumer: Consumer, group: _PipeGroup):
+        self.consumer = consumer
+        self.group = group
+
+    def ready(self, hub: "Hub", key: selectors.SelectorKey) -> bool:
+        """Read one chunk, returns `False` if there was nothing to read."""
+        try:
+            data = os.read(key.fd, CHUNK_SIZE)
+        except BlockingIOError:
+            return False
+        except OSError:
+            logger.exception("Failed to read from pipe.")
+            data = b""
+        if data:
+            self.consumer.feed(data)
+            return True
+        hub._unregister(key.fileobj)
+        key.fileobj.close()
+        try:
+            self.consumer.finish()
+        finally:
+            self.group.finished()
+        return False
+
+
+class Hub(Singleton):
+    """Service the pipes and exit notifications of all children."""
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._pending_lock = threading.Lock()
+        self._pending: List[Callable[[], None]] = []
+        # Registrations are applied by the hub thread, the wakeup pipe
+        # interrupts the select call when there are new ones.
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def pidfd_supported() -> bool:
+        """Check if exit notifications through pidfds are available."""
+        return hasattr(os, "pidfd_open")
+
+    def is_hub_thread(self) -> bool:
+        """`True` if called from the hub thread."""
+        return threading.current_thread() is self._thread
+
+    def strand(self) -> Strand:
+        """Create a strand running callables on the callback threads."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=CALLBACK_THREADS,
+                    thread_name_prefix="tea-callback",
+                )
+        return Strand(self._executor)
+
+    def add_child(self, pid: int, callback: Callable[[], None]):
+        """Call `callback` from the hub thread once the child `pid` exits.
+
+        The child is not reaped, the callback is responsible for it. It's
+        called from the hub thread and must not block.
+
+        Raises:
+            OSError: If the pidfd can't be opened.
+        """
+        self.__register(os.pidfd_open(pid), _Child(callback))
+
+    def add_pipes(
+        self,
+        pipes: Dict[object, Union[Consumer, Fanout]],
+        on_done: Optional[Callable[[], None]] = None,
+    ):
+        """Drain pipes into consumers from the hub thread.
+
+        Args:
+            pipes: Mapping from a readable file object to the consumer that
+                should receive its data: a `PipeBuffer`, a `TextDispatcher`,
+                a `FileWriter` or a `Fanout` of multiple consumers. Pipes are
+                closed when they reach EOF.
+            on_done: Optional callable called when all pipes reached EOF.
+                It's called from the hub thread and must not block.
+        """
+        group = _PipeGroup(len(pipes), on_done)
+        for pipe, consumer in pipes.items():
+            os.set_blocking(pipe.fileno(), False)
+            self.__register(pipe, _Pipe(consumer, group))
+
+    def drain(self, pipes: List[object], callback: Callable[[], None]):
+        """Read everything that's already buffered in the pipes.
+
+        Once a child has exited all of its output is buffered in the pipes,
+        but they only reach EOF when every descendant that inherited them
+        has closed them too. Draining captures the output of the child
+        without waiting for its descendants. Pipes that don't reach EOF stay
+        registered.
+
+        Args:
+            pipes: Pipes previously registered with `add_pipes`.
+            callback: Called from the hub thread once the pipes were drained.
+                It must not block.
+        """
+        self.__call_soon(lambda: self.__drain(pipes, callback))
+
+    def __drain(self, pipes, callback):
+        keys = self._selector.get_map()
+        try:
+            for pipe in pipes:
+                # Pipes that reached EOF are closed and unregistered.
+                key = None if pipe.closed else keys.get(pipe)
+                if key is None:
+                    continue
+                while key.data.ready(self, key):
+                    pass
+        finally:
+            callback()
+
+    def __register(self, fileobj, handler):
+        def register():
+            self._selector.register(fileobj, selectors.EVENT_READ, handler)
+
+        self.__call_soon(register)
+
+    def __call_soon(self, func: Callable[[], None]):
+        # Run `func` from the hub thread.
+        with self._pending_lock:
+            self._pending.append(func)
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            # The pipe is full, the hub thread is going to wake up anyway.
+            pass
+
+    def _unregister(self, fileobj):
+        self._selector.unregister(fileobj)
+
+    def __apply_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for func in pending:
+            try:
+                func()
+            except Exception:
+                logger.exception("Hub call %r failed.", func)
+
+    def _run(self):
+        while True:
+            self.__apply_pending()
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    try:
+                        while os.read(self._wakeup_read, CHUNK_SIZE):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    key.data.ready(self, key)
+                except Exception:
+                    logger.exception("Hub callback failed.")
+
+
+def _reset_after_fork():
+    # Threads don't survive a fork, the child has to create its own hub.
+    Hub._instance = None
+    Hub._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
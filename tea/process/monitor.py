@@ -0,0 +1,232 @@
+"""Background sampling of CPU and memory usage of running processes."""
+
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+import psutil
+
+from tea.process.process import Process, ProcessError
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Sample:
+    """Single measurement of a running process.
+
+    Attributes:
+        time: Timestamp of the measurement.
+        cpu_percent: CPU utilization since the previous sample. Can be more
+            than 100 for processes running on multiple CPUs.
+        rss: Resident set size in bytes.
+    """
+
+    time: float
+    cpu_percent: float
+    rss: int
+
+
+@dataclass(frozen=True)
+class Summary:
+    """Summary of the samples of a process.
+
+    Attributes:
+        samples: Number of samples the summary is computed from.
+        peak_cpu_percent: Highest CPU utilization.
+        mean_cpu_percent: Average CPU utilization.
+        peak_rss: Highest resident set size in bytes.
+        mean_rss: Average resident set size in bytes.
+    """
+
+    samples: int
+    peak_cpu_percent: float
+    mean_cpu_percent: float
+    peak_rss: int
+    mean_rss: float
+
+    @classmethod
+    def from_samples(cls, samples: List[Sample]):
+        if not samples:
+            return cls(0, 0.0, 0.0, 0, 0.0)
+        cpu = [s.cpu_percent for s in samples]
+        rss = [s.rss for s in samples]
+        return cls(
+            samples=len(samples),
+            peak_cpu_percent=max(cpu),
+            mean_cpu_percent=sum(cpu) / len(cpu),
+            peak_rss=max(rss),
+            mean_rss=sum(rss) / len(rss),
+        )
+
+
+class _Series:
+    __slots__ = ("process", "handle", "samples", "finished")
+
+    def __init__(self, process: Process, handle: psutil.Process, size: int):
+        self.process = process
+        self.handle = handle
+        self.samples: Deque[Sample] = deque(maxlen=size)
+        self.finished = False
+
+
+class Monitor:
+    """Sample CPU and memory usage of processes from a background thread.
+
+    All registered processes are sampled by a single thread every `interval`
+    seconds. Only the last `history` samples of every process are kept, so
+    the memory used by the monitor doesn't grow with the running time.
+
+    Samples of a process that has finished are kept until the process is
+    unregistered.
+
+    Usage::
+
+        >>> with Monitor(interval=0.5) as monitor:
+        ...     p = Process(['python', 'job.py'])
+        ...     p.start()
+        ...     monitor.register(p)
+        ...     p.wait()
+        >>> monitor.summary(p).peak_rss
+        104857600
+
+    Args:
+        interval: Seconds between two samples.
+        history: Maximum number of samples kept per process.
+    """
+
+    def __init__(self, interval: float = 1.0, history: int = 600):
+        self._interval = interval
+        self._history = history
+        self._lock = threading.Lock()
+        self._series: Dict[Process, _Series] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the sampling thread if it isn't already running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread. Collected samples are kept."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+
+    def register(self, process: Process):
+        """Start sampling a running process.
+
+        The sampling thread is started if necessary.
+
+        Args:
+            process: Started process.
+
+        Raises:
+            ProcessError: If the process is not running.
+        """
+        try:
+            handle = psutil.Process(process.pid)
+            # The first call only sets the reference point
+            handle.cpu_percent()
+        except (AttributeError, psutil.Error):
+            raise ProcessError(message="Process is not running.")
+        with self._lock:
+            self._series[process] = _Series(
+                process, handle, self._history
+            )
+        self.start()
+
+    def unregister(self, process: Process):
+        """Stop sampling a process and drop its samples.
+
+        Args:
+            process: Registered process.
+        """
+        with self._lock:
+            self._series.pop(process, None)
+
+    @property
+    def processes(self) -> List[Process]:
+        """Registered processes."""
+        with self._lock:
+            return list(self._series)
+
+    def samples(self, process: Process) -> List[Sample]:
+        """Collected samples of a process, oldest first.
+
+        Args:
+            process: Registered process.
+
+        Returns:
+            List[Sample]: Samples of the process.
+        """
+        with self._lock:
+            series = self._series.get(process)
+            return [] if series is None else list(series.samples)
+
+    def summary(self, process: Process) -> Summary:
+        """Peak and mean usage of a process.
+
+        Args:
+            process: Registered process.
+
+        Returns:
+            Summary: Summary of the collected samples.
+        """
+        return Summary.from_samples(self.samples(process))
+
+    @staticmethod
+    def __sample(series: _Series) -> Optional[Sample]:
+        # Children are reaped as soon as they exit, so their PIDs can be
+        # reused right away. The state of the `Process` tells if the PID
+        # still belongs to it: while it's running it hasn't been reaped, so
+        # a sample taken before the check is checked again is valid.
+        if not series.process.is_running:
+            return None
+        handle = series.handle
+        try:
+            with handle.oneshot():
+                sample = Sample(
+                    time=time.time(),
+                    cpu_percent=handle.cpu_percent(),
+                    rss=handle.memory_info().rss,
+                )
+        except psutil.Error:
+            return None
+        if not series.process.is_running:
+            return None
+        return sample
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            with self._lock:
+                active = [s for s in self._series.values() if not s.finished]
+            for series in active:
+                try:
+                    sample = self.__sample(series)
+                except Exception:
+                    logger.exception("Failed to sample process.")
+                    continue
+                with self._lock:
+                    if sample is None:
+                        series.finished = True
+                    else:
+                        series.samples.append(sample)
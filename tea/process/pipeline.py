@@ -0,0 +1,205 @@
+"""Chain processes like a shell pipeline without a shell."""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Union
+
+from tea.process.process import Process, ProcessError, kill
+
+
+logger = logging.getLogger(__name__)
+
+
+def _feed(fd: int, data: bytes):
+    # Write the input to the first stage and close the pipe so it sees EOF.
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    except BrokenPipeError:
+        # The first stage exited without reading all of the input.
+        pass
+    finally:
+        os.close(fd)
+
+
+class Pipeline:
+    r"""Processes connected like `a | b | c`.
+
+    The standard output of every stage is connected to the standard input of
+    the next stage with an OS pipe, so the data flows directly between the
+    children, without a shell or a copy through python. The standard output
+    of the last stage and the standard error of every stage are captured.
+
+    Usage::
+
+        >>> pipeline = Pipeline([['cat', 'access.log'], ['grep', 'GET'],
+        ...                      ['wc', '-l']])
+        >>> pipeline.start()
+        >>> pipeline.wait()
+        >>> pipeline.exit_codes, pipeline.read()
+        ([0, 0, 0], '42\n')
+
+    Args:
+        commands: Commands of the stages.
+        env: Optional additional environment variables for all stages.
+        working_dir: Working directory of all stages.
+        stdin: Path or file object used as the standard input of the first
+            stage. Its file descriptor is passed to the child directly, so
+            the file is never read by the parent.
+        input: Data written to the standard input of the first stage.
+        encoding: Encoding used to decode the output.
+        capture: How to capture the output of the last stage, see
+            `Process`.
+        spawn: How to start the stages, see `Process`.
+    """
+
+    def __init__(
+        self,
+        commands: List[Union[str, List[str]]],
+        env: Optional[Dict[str, str]] = None,
+        working_dir: Optional[str] = None,
+        stdin: Optional[Union[str, Path, IO]] = None,
+        input: Optional[bytes] = None,
+        encoding: str = "utf-8",
+        capture: str = "file",
+        spawn: str = "auto",
+    ):
+        if not commands:
+            raise ProcessError("Pipeline needs at least one command.")
+        if stdin is not None and input is not None:
+            raise ProcessError("stdin and input can't be used together.")
+        self._stdin = stdin
+        self._input = input
+        self._feeder = None
+        last = len(commands) - 1
+        self._stages = [
+            Process(
+                command,
+                env=env,
+                working_dir=working_dir,
+                encoding=encoding,
+                capture=capture if i == last else "file",
+                spawn=spawn,
+            )
+            for i, command in enumerate(commands)
+        ]
+
+    @property
+    def stages(self) -> List[Process]:
+        """Processes of the pipeline in order."""
+        return self._stages
+
+    def __open_stdin(self):
+        # Returns the descriptor for the first stage and the descriptors that
+        # have to be closed once it has started.
+        if self._input is not None:
+            read, write = os.pipe()
+            return read, [read], write
+        if self._stdin is None:
+            fd = os.open(os.devnull, os.O_RDONLY)
+            return fd, [fd], None
+        if isinstance(self._stdin, (str, Path)):
+            fd = os.open(self._stdin, os.O_RDONLY)
+            return fd, [fd], None
+        return self._stdin.fileno(), [], None
+
+    def start(self):
+        """Start all stages."""
+        source, owned, feed = self.__open_stdin()
+        started = []
+        try:
+            for stage in self._stages:
+                if stage is self._stages[-1]:
+                    sink = None
+                    stage._connect(stdin=source)
+                else:
+                    # The read end is closed after the next stage started.
+                    read, sink = os.pipe()
+                    owned.append(read)
+                    stage._connect(stdin=source, stdout=sink)
+                try:
+                    stage.start()
+                finally:
+                    # Only the children may keep the pipe ends open, otherwise
+                    # the stages never see EOF.
+                    if sink is not None:
+                        os.close(sink)
+                    if source in owned:
+                        owned.remove(source)
+                        os.close(source)
+                started.append(stage)
+                if sink is not None:
+                    source = read
+        except BaseException:
+            for fd in owned:
+                os.close(fd)
+            if feed is not None:
+                os.close(feed)
+            for stage in started:
+                stage.kill()
+            raise
+        if feed is not None:
+            self._feeder = threading.Thread(
+                target=_feed, args=(feed, self._input), daemon=True
+            )
+            self._feeder.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for all stages to finish.
+
+        Args:
+            timeout: Maximum number of seconds to wait, `None` waits until
+                the pipeline finishes.
+
+        Returns:
+            bool: `True` if all stages have finished.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for stage in self._stages:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            if not stage.wait(remaining):
+                return False
+        return True
+
+    def kill(self):
+        """Kill all stages that are still running and wait for them."""
+        for stage in self._stages:
+            if stage.is_running:
+                try:
+                    kill(stage.pid)
+                except OSError:
+                    pass
+        self.wait()
+
+    @property
+    def is_running(self) -> bool:
+        """`True` if any of the stages is still running."""
+        return any(stage.is_running for stage in self._stages)
+
+    @property
+    def exit_codes(self) -> List[Optional[int]]:
+        """Exit codes of all stages, `None` for stages still running."""
+        return [stage.exit_code for stage in self._stages]
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        """Exit code of the last stage."""
+        return self._stages[-1].exit_code
+
+    def read(self) -> str:
+        """Read the standard output of the last stage."""
+        return self._stages[-1].read()
+
+    def eread(self, stage: int = -1) -> str:
+        """Read the standard error of a stage.
+
+        Args:
+            stage: Index of the stage, the last one by default.
+        """
+        return self._stages[stage].eread()
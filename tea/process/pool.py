@@ -0,0 +1,295 @@
+"""Pool of warm Python interpreters.
+
+Starting a new interpreter for every short Python command costs tens of
+milliseconds. `WorkerPool` keeps a set of interpreters running, optionally
+with modules already imported, and runs scripts, code and callables in them.
+"""
+
+import os
+import sys
+import runpy
+import tempfile
+import importlib
+import itertools
+import threading
+import traceback
+import multiprocessing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import psutil
+
+from tea.process.process import ProcessError
+
+
+# Seconds between two checks if the worker running a task is still alive.
+_POLL_INTERVAL = 0.1
+
+# Queue the workers use to report which task they started.
+_started = None
+
+
+def _initialize(modules: Iterable[str], started):
+    global _started
+
+    _started = started
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+def _exit_code(code) -> int:
+    # Same conventions as the interpreter uses for SystemExit
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run(
+    task: int, func: Callable, args: tuple, kwargs: dict
+) -> Tuple[int, bytes, bytes]:
+    _started.put((task, os.getpid()))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    streams = sys.stdout, sys.stderr
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        # Redirect on the file descriptor level so the output of extension
+        # modules and subprocesses is captured too, and point the Python
+        # streams at the redirected descriptors in case they were replaced.
+        os.dup2(out.fileno(), 1)
+        os.dup2(err.fileno(), 2)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        try:
+            try:
+                func(*args, **kwargs)
+                exit_code = 0
+            except SystemExit as e:
+                exit_code = _exit_code(e.code)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            sys.stdout, sys.stderr = streams
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+        out.seek(0)
+        err.seek(0)
+        return exit_code, out.read(), err.read()
+
+
+def _run_main(argv: List[str], run: Callable[[], Any]):
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        run()
+    finally:
+        sys.argv = saved_argv
+
+
+def _run_script(path: str, args: List[str]):
+    def run():
+        # Same as `python script.py`, modules next to the script can be
+        # imported.
+        saved_path = sys.path[0]
+        sys.path[0] = os.path.dirname(os.path.abspath(path))
+        try:
+            runpy.run_path(path, run_name="__main__")
+        finally:
+            sys.path[0] = saved_path
+
+    _run_main([path] + list(args), run)
+
+
+def _run_code(code: str, args: List[str]):
+    def run():
+        exec(compile(code, "<string>", "exec"), {"__name__": "__main__"})
+
+    _run_main(["-c"] + list(args), run)
+
+
+class WorkerPool:
+    r"""Pool of warm Python interpreters.
+
+    Every task runs in one of the worker processes with its standard output
+    and error captured, and the result has the same form as the result of
+    `tea.process.execute`. Workers are replaced with fresh interpreters after
+    `max_tasks` tasks, so state left behind by the tasks doesn't accumulate.
+
+    Tasks share the interpreter with the tasks that ran before them in the
+    same worker, so the pool is meant for commands that don't depend on a
+    pristine interpreter. If a worker dies while running a task, e.g. the
+    task calls `os._exit`, crashes or is killed, the call raises
+    `ProcessError` and the worker is replaced.
+
+    Usage::
+
+        >>> with WorkerPool(processes=4, preload=['json']) as pool:
+        ...     status, out, err = pool.execute_code('print(1 + 1)')
+        >>> out
+        '2\n'
+
+    Args:
+        processes: Number of worker processes. Defaults to the number of
+            CPUs.
+        max_tasks: Number of tasks a worker runs before it's replaced. If
+            `None` workers live as long as the pool.
+        preload: Modules imported by every worker when it starts.
+        context: Multiprocessing start method (`fork`, `spawn` or
+            `forkserver`). Defaults to the platform default.
+        encoding: Encoding used to decode the standard output and error.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        max_tasks: Optional[int] = 100,
+        preload: Iterable[str] = (),
+        context: Optional[str] = None,
+        encoding: str = "utf-8",
+    ):
+        self._encoding = encoding
+        context = multiprocessing.get_context(context)
+        self._started = context.SimpleQueue()
+        self._tasks = itertools.count()
+        # Task -> PID of the worker running it
+        self._workers: Dict[int, int] = {}
+        self._workers_lock = threading.Lock()
+        # Set when a task was lost with its worker
+        self._lost = False
+        self._pool = context.Pool(
+            processes=processes,
+            initializer=_initialize,
+            initargs=(list(preload), self._started),
+            maxtasksperchild=max_tasks,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Wait for the submitted tasks and stop the workers.
+
+        If a task was lost because its worker died, the pool would wait for
+        it forever, so the workers are terminated instead.
+        """
+        if self._lost:
+            self.terminate()
+            return
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stop the workers immediately."""
+        self._pool.terminate()
+        self._pool.join()
+
+    def __worker(self, task: int) -> Optional[int]:
+        with self._workers_lock:
+            while not self._started.empty():
+                started, pid = self._started.get()
+                self._workers[started] = pid
+            return self._workers.get(task)
+
+    def __wait(self, task: int, result):
+        # A pool doesn't notice when a worker dies while running a task, the
+        # result would never arrive. Check the worker while waiting.
+        try:
+            while not result.ready():
+                result.wait(_POLL_INTERVAL)
+                pid = self.__worker(task)
+                if result.ready() or pid is None or _is_alive(pid):
+                    continue
+                # The worker may have exited right after sending the result.
+                result.wait(1)
+                if not result.ready():
+                    self._lost = True
+                    raise ProcessError(
+                        message=f"Worker {pid} died while running the task."
+                    )
+            return result.get()
+        finally:
+            # The worker reported the task before sending its result, so
+            # the report is drained here at the latest.
+            self.__worker(task)
+            with self._workers_lock:
+                self._workers.pop(task, None)
+
+    def __apply(self, func, args, kwargs=None) -> Tuple[int, str, str]:
+        task = next(self._tasks)
+        result = self._pool.apply_async(
+            _run, (task, func, args, kwargs or {})
+        )
+        exit_code, out, err = self.__wait(task, result)
+        encoding = self._encoding
+        return exit_code, out.decode(encoding), err.decode(encoding)
+
+    def execute(
+        self, script: str, args: Iterable[str] = ()
+    ) -> Tuple[int, str, str]:
+        """Run a script like `python script.py args...`.
+
+        Args:
+            script: Path to the script.
+            args: Command line arguments passed in `sys.argv`.
+
+        Returns:
+            Tuple[int, str, str]: (exit_code, stdout, stderr)
+
+        Raises:
+            ProcessError: If the worker died while running the task.
+        """
+        return self.__apply(_run_script, (script, list(args)))
+
+    def execute_code(
+        self, code: str, args: Iterable[str] = ()
+    ) -> Tuple[int, str, str]:
+        """Run code like `python -c code args...`.
+
+        Args:
+            code: Python source code.
+            args: Command line arguments passed in `sys.argv`.
+
+        Returns:
+            Tuple[int, str, str]: (exit_code, stdout, stderr)
+
+        Raises:
+            ProcessError: If the worker died while running the task.
+        """
+        return self.__apply(_run_code, (code, list(args)))
+
+    def call(self, func: Callable, *args, **kwargs) -> Tuple[int, str, str]:
+        """Call a function in a worker.
+
+        The function and the arguments have to be picklable. The return
+        value of the function is ignored, the exit code is 0 unless the
+        function raises `SystemExit` or another exception.
+
+        Args:
+            func: Function to call.
+            args: Positional arguments.
+            kwargs: Keyword arguments.
+
+        Returns:
+            Tuple[int, str, str]: (exit_code, stdout, stderr)
+
+        Raises:
+            ProcessError: If the worker died while running the task.
+        """
+        return self.__apply(func, args, kwargs)
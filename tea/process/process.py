@@ -1,16 +1,48 @@
 import io
 import os
+import sys
+import stat
+import mmap
+import errno
 import time
+import codecs
 import posix
 import signal
 import logging
+import resource
 import threading
 import subprocess
 from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import Future
 from tempfile import NamedTemporaryFile
-from typing import Optional, Dict, Union, List
+from typing import (
+    IO,
+    Optional,
+    Dict,
+    Union,
+    List,
+    Generator,
+    Iterable,
+    Callable,
+    Tuple,
+)
+
+import psutil
 
 from tea.errors import TeaError
+from tea.process.hub import Hub
+from tea.process.reaper import watch
+from tea.process.watchdog import Watchdog
+from tea.process.spawn import SPAWN_STRATEGIES, use_posix_spawn, posix_spawn
+from tea.process.capture import (
+    CHUNK_SIZE,
+    Deferred,
+    Fanout,
+    FileWriter,
+    PipeBuffer,
+    TextDispatcher,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -26,23 +58,217 @@ class ExecutableNotFound(ProcessError):
         super().__init__(message=f"Executable not found: {command}")
 
 
+class ProcessTimeout(ProcessError):
+    def __init__(self, command, timeout, exit_code, stdout, stderr=""):
+        self.command = command
+        self.timeout = timeout
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        super().__init__(
+            message=f"Process timed out after {timeout} seconds: {command}"
+        )
+
+
+class _EnvironmentCache:
+    """Stringified snapshot of `os.environ`.
+
+    The snapshot is rebuilt only when `os.environ` changes. Changes are
+    detected by comparing the raw environment data with the data the snapshot
+    was built from, which is a lot cheaper than copying the environment.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._env = None
+
+    def get(self) -> Dict[str, str]:
+        # `os._Environ` keeps the encoded environment in `_data`, every
+        # change made through `os.environ` is reflected there.
+        data = getattr(os.environ, "_data", None)
+        with self._lock:
+            if self._env is None or data is None or data != self._data:
+                self._data = None if data is None else dict(data)
+                self._env = {
+                    str(key): str(value) for key, value in os.environ.items()
+                }
+            return self._env
+
+
+_environment = _EnvironmentCache()
+
+
 def _create_env(env):
-    full_env = {str(key): str(value) for key, value in os.environ.items()}
-    if env is not None:
-        full_env.update({str(key): str(value) for key, value in env.items()})
+    """Create the environment for a child process.
+
+    Returns `None` if there are no overrides, so the child inherits the
+    environment directly and no dictionary has to be built.
+    """
+    if env is None:
+        return None
+    full_env = dict(_environment.get())
+    full_env.update({str(key): str(value) for key, value in env.items()})
     return full_env
 
 
-def kill(pid):
+@dataclass(frozen=True)
+class ResourceUsage:
+    """Resource usage of a finished process.
+
+    Attributes:
+        user_time: Time spent in user mode in seconds.
+        system_time: Time spent in kernel mode in seconds.
+        max_rss: Maximum resident set size in bytes.
+        voluntary_switches: Number of voluntary context switches.
+        involuntary_switches: Number of involuntary context switches.
+        start_time: Timestamp when the process was started.
+        end_time: Timestamp when the process has exited.
+    """
+
+    user_time: float
+    system_time: float
+    max_rss: int
+    voluntary_switches: int
+    involuntary_switches: int
+    start_time: float
+    end_time: float
+
+    @property
+    def wall_time(self) -> float:
+        """Wall clock time the process was running in seconds."""
+        return self.end_time - self.start_time
+
+    @classmethod
+    def from_rusage(
+        cls, rusage: resource.struct_rusage, start_time: float, end_time: float
+    ):
+        # ru_maxrss is in kilobytes everywhere except on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return cls(
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * scale,
+            voluntary_switches=rusage.ru_nvcsw,
+            involuntary_switches=rusage.ru_nivcsw,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+
+def _descendants(pid):
+    try:
+        return psutil.Process(pid).children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def _in_group(child: psutil.Process, pgid: int) -> bool:
+    try:
+        return child.is_running() and os.getpgid(child.pid) == pgid
+    except (psutil.Error, OSError):
+        return False
+
+
+def _signal_descendants(descendants, sig):
+    for child in descendants:
+        try:
+            child.send_signal(sig)
+        except psutil.Error:
+            pass
+
+
+_IONICE_CLASSES = {
+    "idle": "IOPRIO_CLASS_IDLE",
+    "best-effort": "IOPRIO_CLASS_BE",
+    "realtime": "IOPRIO_CLASS_RT",
+}
+
+
+def _preexec_limits(
+    cpu_affinity: Optional[Iterable[int]] = None,
+    nice: Optional[int] = None,
+    ionice: Optional[Union[str, Tuple[str, int]]] = None,
+    rlimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
+) -> Optional[Callable[[], None]]:
+    """Create a function that applies the limits in the child before exec.
+
+    Everything is validated and resolved in the parent, so the child only
+    makes the system calls.
+
+    Returns:
+        The function or `None` if there are no limits.
+
+    Raises:
+        ProcessError: If a limit is invalid or not supported.
+    """
+    actions = []
+    if cpu_affinity is not None:
+        if not hasattr(os, "sched_setaffinity"):
+            raise ProcessError("cpu_affinity is not supported")
+        cpus = set(cpu_affinity)
+        actions.append(lambda: os.sched_setaffinity(0, cpus))
+    if nice is not None:
+        actions.append(lambda: os.nice(nice))
+    if ionice is not None:
+        ioclass, value = (ionice, None) if isinstance(ionice, str) else ionice
+        constant = getattr(psutil, _IONICE_CLASSES.get(ioclass, ""), None)
+        if constant is None:
+            raise ProcessError(f"Unsupported ionice class: {ioclass}")
+        actions.append(lambda: psutil.Process().ionice(constant, value))
+    for name, limit in (rlimits or {}).items():
+        rlimit = getattr(resource, f"RLIMIT_{name.upper()}", None)
+        if rlimit is None:
+            raise ProcessError(f"Unsupported rlimit: {name}")
+
+        def set_rlimit(rlimit=rlimit, limit=limit):
+            if isinstance(limit, int):
+                # Only lower the soft limit, so the hard one is kept
+                limit = (limit, resource.getrlimit(rlimit)[1])
+            resource.setrlimit(rlimit, limit)
+
+        actions.append(set_rlimit)
+    if not actions:
+        return None
+
+    def preexec():
+        for action in actions:
+            action()
+
+    return preexec
+
+
+def _set_cpu_affinity(pid: int, cpus: Iterable[int]):
+    # sched_setaffinity only changes one thread, so set it for all of them.
+    cpus = set(cpus)
+    try:
+        threads = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        threads = [pid]
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass
+
+
+def kill(pid, sig=signal.SIGKILL, tree=False):
     """Kills a process by it's process ID.
 
+    If the process is a process group leader the whole group is killed.
+
     Args:
         pid (int): Process ID of the process to kill.
+        sig (int): Signal to send. Default: `SIGKILL`.
+        tree (bool): Also send the signal to all descendants of the process,
+            even the ones that left its process group.
     """
+    descendants = _descendants(pid) if tree else []
     if pid == posix.getpgid(pid):
-        os.killpg(pid, signal.SIGKILL)
+        os.killpg(pid, sig)
     else:
-        os.kill(pid, signal.SIGKILL)
+        os.kill(pid, sig)
+    _signal_descendants(descendants, sig)
 
 
 class Process:
@@ -75,6 +301,21 @@ class Process:
         redirect_output: bool = True,
         working_dir: Optional[str] = None,
         encoding: str = "utf-8",
+        capture: str = "file",
+        capture_spill: Optional[int] = None,
+        capture_limit: Optional[int] = None,
+        spawn: str = "auto",
+        new_session: bool = False,
+        timeout: Optional[float] = None,
+        kill_grace: float = 5,
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+        callback_mode: str = "line",
+        tee_to: Optional[Union[str, Path, IO, logging.Logger]] = None,
+        cpu_affinity: Optional[Iterable[int]] = None,
+        nice: Optional[int] = None,
+        ionice: Optional[Union[str, Tuple[str, int]]] = None,
+        rlimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
     ):
         """Create a Process object.
 
@@ -106,11 +347,75 @@ class Process:
                 be started.
             encoding: Encoding to use to decode the standard output and
                 standard error.
+            capture: How to capture the output if it's redirected. `file`
+                writes it to temporary files, `pipe` reads it from OS pipes
+                into in-memory buffers and enables `iter_chunks` and
+                `iter_lines`. `pipe` can't be combined with `stdout` and
+                `stderr` paths.
+            capture_spill: Only with `pipe` capture. Number of bytes per
+                stream kept in memory, everything after that is spilled to a
+                temporary file. By default everything is kept in memory.
+            capture_limit: Only with `pipe` capture. Maximum number of bytes
+                kept per stream. Only the first and the last half of the limit
+                are kept, the number of dropped bytes is available through
+                `stdout_dropped` and `stderr_dropped`.
+            spawn: How to start the process. `fork` uses `subprocess.Popen`,
+                `posix_spawn` uses `os.posix_spawn` which is faster for
+                parents with a large resident set on platforms where `Popen`
+                forks. `posix_spawn` falls back to `fork` when the process
+                needs features it can't express, like a working directory.
+                `auto` picks `posix_spawn` only where `Popen` would fork.
+            new_session: Start the process in its own session and process
+                group, so `kill` kills all of its descendants too.
+            timeout: Maximum number of seconds the process is allowed to run.
+                When it's exceeded `SIGTERM` is sent to the whole process
+                tree, followed by `SIGKILL` after `kill_grace` seconds. Setting
+                a timeout implies `new_session`.
+            kill_grace: Seconds to wait between `SIGTERM` and `SIGKILL` when
+                the timeout is exceeded.
+            on_stdout: Only with `pipe` capture. Called with the standard
+                output as it arrives, from one of the shared callback
+                threads. Calls for one process are made in order and all of
+                them are made before `wait` returns, so a callback that
+                blocks only delays its own process. The output is still
+                captured.
+            on_stderr: Only with `pipe` capture. Same as `on_stdout` for the
+                standard error.
+            callback_mode: `line` calls the callbacks with every line,
+                including the line ending, `chunk` with every decoded chunk
+                read from the pipe.
+            tee_to: Only with `pipe` capture. Also write the standard output
+                and error to a file path, a file object or a logger. Loggers
+                log every line of the standard output with `INFO` and of the
+                standard error with `WARNING` level.
+            cpu_affinity: CPUs the process is allowed to run on. Linux only.
+            nice: Niceness increment, like the `nice` command.
+            ionice: I/O scheduling class, `idle`, `best-effort` or
+                `realtime`, or a tuple of the class and the priority level.
+                Linux only.
+            rlimits: Resource limits by name, e.g. `as` (address space in
+                bytes), `cpu` (CPU seconds) or `nofile` (open files). An
+                integer sets the soft limit, a tuple both the soft and the
+                hard limit.
+
+            `cpu_affinity`, `nice`, `ionice` and `rlimits` are applied in the
+            child before the command is executed, which requires the `fork`
+            spawn strategy. Children inherit them.
         """
         self._commandline = [command] if isinstance(command, str) else command
         self._env = env
         self._process = None
-        self._wait_thread = None
+        # Set once the process was reaped, and once it was reaped and its
+        # output was captured and passed to the callbacks.
+        self._exited = threading.Event()
+        self._finished = threading.Event()
+        self._strand = None
+        self._pending = set()
+        self._pipes = []
+        self._pending_lock = threading.Lock()
+        self._start_time = None
+        self._rusage = None
+        self._returncode = None
         self._pid = None
         self._immutable = False
         self._working_dir = working_dir
@@ -118,8 +423,11 @@ class Process:
         self._demux = demux
         self._redirect_output = stdout or stderr or redirect_output
         self._encoding = encoding
+        self._stdout_decoder = None
+        self._stderr_decoder = None
         # stdin
         self._stdin = None
+        self._stdin_source = None
         # stdout
         if stdout_mode not in ("w", "a"):
             raise ProcessError("stdout_mode can be either `w` or `a`")
@@ -128,6 +436,7 @@ class Process:
         self._stdout = Path(stdout).absolute() if stdout else None
         self._stdout_reader = None
         self._stdout_writer = None
+        self._stdout_sink = None
         # stderr
         if stderr_mode not in ("w", "a"):
             raise ProcessError("stderr_mode can be either `w` or `a`")
@@ -136,13 +445,88 @@ class Process:
         self._stderr = Path(stderr).absolute() if stderr else None
         self._stderr_reader = None
         self._stderr_writer = None
+        # tee
+        self._tee_file = None
+        # Capture
+        if capture not in ("file", "pipe"):
+            raise ProcessError("capture can be either `file` or `pipe`")
+        if capture == "pipe" and (stdout or stderr):
+            raise ProcessError(
+                "stdout and stderr files can't be used with `pipe` capture"
+            )
+        if capture != "pipe" and (
+            capture_spill is not None or capture_limit is not None
+        ):
+            raise ProcessError(
+                "capture_spill and capture_limit require `pipe` capture"
+            )
+        self._capture = capture
+        self._capture_spill = capture_spill
+        self._capture_limit = capture_limit
+        # Output consumers
+        if capture != "pipe" and (on_stdout or on_stderr or tee_to):
+            raise ProcessError(
+                "on_stdout, on_stderr and tee_to require `pipe` capture"
+            )
+        if callback_mode not in ("line", "chunk"):
+            raise ProcessError(
+                "callback_mode can be either `line` or `chunk`"
+            )
+        self._on_stdout = on_stdout
+        self._on_stderr = on_stderr
+        self._callback_mode = callback_mode
+        self._tee_to = tee_to
+        # Spawn strategy
+        if spawn not in SPAWN_STRATEGIES:
+            raise ProcessError(
+                "spawn can be either `auto`, `posix_spawn` or `fork`"
+            )
+        self._spawn = spawn
+        # Session and timeout
+        self._new_session = new_session or timeout is not None
+        self._timeout = timeout
+        self._kill_grace = kill_grace
+        self._timers = []
+        self._timed_out = False
+        # Descendants that were sent SIGTERM on timeout and the timer that
+        # escalates to SIGKILL.
+        self._doomed = []
+        self._escalation = None
+        self._future = None
+        # Limits
+        self._preexec_fn = _preexec_limits(
+            cpu_affinity=cpu_affinity,
+            nice=nice,
+            ionice=ionice,
+            rlimits=rlimits,
+        )
 
     def __open_files(self):
         if self._redirect_output:
             # stdin
-            self._stdin = subprocess.PIPE
+            if self._stdin_source is not None:
+                self._stdin = self._stdin_source
+            else:
+                self._stdin = subprocess.PIPE
+            if self._capture == "pipe":
+                self._stdout_writer = subprocess.PIPE
+                self._stdout_reader = PipeBuffer(
+                    self._capture_spill, self._capture_limit
+                )
+                if self._demux:
+                    self._stderr_writer = subprocess.PIPE
+                    self._stderr_reader = PipeBuffer(
+                        self._capture_spill, self._capture_limit
+                    )
+                else:
+                    self._stderr_writer = subprocess.STDOUT
+                if isinstance(self._tee_to, (str, Path)):
+                    self._tee_file = io.open(self._tee_to, "wb")
+                return
             # stdout
-            if self._stdout:
+            if self._stdout_sink is not None:
+                self._stdout_writer = self._stdout_sink
+            elif self._stdout:
                 self._stdout_writer = io.open(
                     self._stdout, self._stdout_mode + "b"
                 )
@@ -168,6 +552,27 @@ class Process:
             self._stdout_writer = io.open(os.devnull, "wb")
             self._stderr_writer = subprocess.STDOUT
 
+    def _connect(
+        self, stdin: Optional[int] = None, stdout: Optional[int] = None
+    ):
+        """Connect the standard streams to file descriptors.
+
+        Used by `Pipeline` to chain processes. The descriptors are owned by
+        the caller, they are duplicated into the child and never closed by
+        the process. `stdout` can only be connected with `file` capture.
+
+        Args:
+            stdin: Descriptor used as the standard input instead of a pipe.
+            stdout: Descriptor used as the standard output, the output is not
+                captured.
+        """
+        if stdout is not None and self._capture != "file":
+            raise ProcessError(
+                "stdout can only be connected with `file` capture"
+            )
+        self._stdin_source = stdin
+        self._stdout_sink = stdout
+
     def __is_open(self, f):
         return f is not None and hasattr(f, "closed") and not f.closed
 
@@ -175,7 +580,7 @@ class Process:
         # Close stdout
         if self.__is_open(self._stdout_tmp):
             self._stdout_tmp.close()
-        if self.__is_open(self._stderr_writer):
+        if self.__is_open(self._stdout_writer):
             self._stdout_writer.close()
         # Close stderr
         if self.__is_open(self._stderr_tmp):
@@ -183,7 +588,12 @@ class Process:
         if self._demux and self.__is_open(self._stderr_writer):
             self._stderr_writer.close()
 
+    def __close_tee(self):
+        if self.__is_open(self._tee_file):
+            self._tee_file.close()
+
     def __close_files(self):
+        self.__close_tee()
         # Close read files
         if self.__is_open(self._stdout_reader):
             self._stdout_reader.close()
@@ -192,9 +602,124 @@ class Process:
         # Close write files
         self.__close_write_files()
 
-    def __process_wait(self):
-        self._process.wait()
+    def __complete(self, part: str):
+        # The process is finished when it has exited and all of the output it
+        # wrote has been read from the pipes: either the pipes reached EOF or
+        # they were drained after the exit. Descendants that inherited the
+        # pipes can keep them open after that.
+        with self._pending_lock:
+            if part not in self._pending:
+                return
+            self._pending.discard(part)
+            if self._pending:
+                return
+        for timer in self._timers:
+            timer.cancel()
+        returncode = self._returncode
+        if self._strand is not None:
+            # After the callbacks that are still queued.
+            self._strand.submit(self.__finish, returncode)
+        else:
+            self.__finish(returncode)
+
+    def __finish(self, returncode: int):
         self.__close_write_files()
+        self._finished.set()
+        if self._future is not None:
+            self._future.set_result(returncode)
+
+    def __terminate(self):
+        if self._finished.is_set():
+            return
+        logger.warning("%s timed out after %s seconds.", self, self._timeout)
+        self._timed_out = True
+        # The process is a session leader, so its process group outlives it
+        # and still reaches the grandchildren after the process was reaped.
+        pgid = self._process.pid
+        self._doomed = _descendants(pgid)
+        try:
+            os.killpg(pgid, signal.SIGTERM)
+        except OSError:
+            pass
+        _signal_descendants(self._doomed, signal.SIGTERM)
+        # Not one of `_timers`, which are cancelled when the process
+        # finishes: descendants that ignore SIGTERM outlive it.
+        self._escalation = Watchdog().schedule(
+            self._kill_grace, lambda: self.__kill_tree(pgid)
+        )
+
+    def __kill_tree(self, pgid: int):
+        self._escalation = None
+        descendants = list(self._doomed)
+        for child in self._doomed:
+            try:
+                descendants.extend(child.children(recursive=True))
+            except psutil.Error:
+                pass
+        process = self._process
+        leader_running = process is not None and process.returncode is None
+        if leader_running:
+            descendants.extend(_descendants(pgid))
+        # Once the leader was reaped its PID can only be reused when the
+        # group is gone, so the group is only signalled while a known member
+        # is still in it.
+        if leader_running or any(_in_group(c, pgid) for c in descendants):
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except OSError:
+                pass
+        _signal_descendants(descendants, signal.SIGKILL)
+
+    def __consumer(self, buffer: PipeBuffer, stderr: bool):
+        # The data read from a pipe is captured in the buffer and passed to
+        # the callback and the tee as is. The buffer is filled from the hub
+        # thread, the callback and the tee run on the strand of the process.
+        consumers = []
+        lines = self._callback_mode == "line"
+        callback = self._on_stderr if stderr else self._on_stdout
+        if callback is not None:
+            consumers.append(
+                TextDispatcher(callback, self._encoding, lines=lines)
+            )
+        tee = self._tee_file or self._tee_to
+        if isinstance(tee, logging.Logger):
+            level = logging.WARNING if stderr else logging.INFO
+            consumers.append(
+                TextDispatcher(
+                    lambda line: tee.log(level, "%s", line.rstrip("\n")),
+                    self._encoding,
+                    lines=True,
+                )
+            )
+        elif isinstance(tee, io.TextIOBase):
+            consumers.append(
+                TextDispatcher(tee.write, self._encoding, lines=lines)
+            )
+        elif tee is not None:
+            consumers.append(FileWriter(tee))
+        if not consumers:
+            return buffer
+        return Fanout(
+            [buffer]
+            + [Deferred(c, self._strand.submit) for c in consumers]
+        )
+
+    def __exited(self, rusage: Optional[resource.struct_rusage]):
+        if rusage is not None:
+            self._rusage = ResourceUsage.from_rusage(
+                rusage, self._start_time, time.time()
+            )
+        self._returncode = self._process.returncode
+        self._exited.set()
+        self.__complete("exit")
+        if self._pipes:
+            Hub().drain(self._pipes, lambda: self.__complete("pipes"))
+
+    def __pipes_closed(self):
+        self.__complete("pipes")
+        if self._tee_file is not None:
+            # After the data that is still queued for the tee.
+            self._strand.submit(self.__close_tee)
 
     @classmethod
     def immutable(cls, pid, command):
@@ -219,79 +744,174 @@ class Process:
         """Full command line."""
         return self._commandline
 
-    def start(self):
-        """Start the process."""
+    def start(self, future: bool = False) -> Optional[Future]:
+        """Start the process.
+
+        Args:
+            future: Return a future that resolves to the exit code once the
+                process has finished and all of its output was captured.
+                Futures of many processes can be used with
+                `concurrent.futures.wait` and `as_completed`.
+
+        Returns:
+            Optional[Future]: The future if `future` is `True`.
+        """
         if self._immutable:
             raise NotImplementedError
 
         # Open all redirects
         self.__open_files()
+        self._exited.clear()
+        self._finished.clear()
+        decoder = codecs.getincrementaldecoder(self._encoding)
+        self._stdout_decoder = decoder()
+        self._stderr_decoder = decoder()
+        self._rusage = None
+        self._returncode = None
+        self._start_time = time.time()
+        self._timers = []
+        self._timed_out = False
+        self._doomed = []
+        self._escalation = None
+        self._future = None
+        if future:
+            self._future = Future()
+            self._future.set_running_or_notify_cancel()
+        self._strand = None
+        if future or (
+            self._capture == "pipe"
+            and (self._on_stdout or self._on_stderr or self._tee_to)
+        ):
+            self._strand = Hub().strand()
 
         try:
-            self._process = subprocess.Popen(
-                self._commandline,
-                stdin=self._stdin,
-                stdout=self._stdout_writer,
-                stderr=self._stderr_writer,
-                env=_create_env(self._env),
-                cwd=self._working_dir,
-            )
+            # posix_spawn can't apply the limits.
+            if self._preexec_fn is None and use_posix_spawn(
+                self._spawn, self._working_dir
+            ):
+                self._process = posix_spawn(
+                    self._commandline,
+                    stdin=self._stdin,
+                    stdout=self._stdout_writer,
+                    stderr=self._stderr_writer,
+                    env=_create_env(self._env),
+                    start_new_session=self._new_session,
+                )
+            else:
+                self._process = subprocess.Popen(
+                    self._commandline,
+                    stdin=self._stdin,
+                    stdout=self._stdout_writer,
+                    stderr=self._stderr_writer,
+                    env=_create_env(self._env),
+                    cwd=self._working_dir,
+                    start_new_session=self._new_session,
+                    preexec_fn=self._preexec_fn,
+                )
         except OSError:
             raise ExecutableNotFound(command=self.command)
-        self._wait_thread = threading.Thread(
-            target=self.__process_wait, daemon=True
-        )
-        self._wait_thread.start()
+        except subprocess.SubprocessError as e:
+            raise ProcessError(f"Failed to apply the process limits: {e}")
+        if self._timeout is not None:
+            # Scheduled before the process is watched, so `__complete`
+            # always sees the timer and cancels it.
+            self._timers.append(
+                Watchdog().schedule(self._timeout, self.__terminate)
+            )
+        self._pending = {"exit"}
+        self._pipes = []
+        if self._redirect_output and self._capture == "pipe":
+            self._pending.add("pipes")
+            pipes = {
+                self._process.stdout: self.__consumer(
+                    self._stdout_reader, stderr=False
+                )
+            }
+            if self._demux:
+                pipes[self._process.stderr] = self.__consumer(
+                    self._stderr_reader, stderr=True
+                )
+            self._pipes = list(pipes)
+            Hub().add_pipes(pipes, on_done=self.__pipes_closed)
+        watch(self._process, self.__exited)
+        return self._future
+
+    def set_cpu_affinity(self, cpus: Iterable[int], tree: bool = False):
+        """Change the CPUs a running process is allowed to run on.
+
+        All threads of the process are moved. Linux only.
+
+        Args:
+            cpus: CPUs the process is allowed to run on.
+            tree: Also move all descendants of the process.
+        """
+        if self._immutable:
+            raise NotImplementedError
+        if not hasattr(os, "sched_setaffinity"):
+            raise ProcessError("cpu_affinity is not supported")
+        if not self.is_running:
+            raise ProcessError("Process is not running.")
+        descendants = _descendants(self.pid) if tree else []
+        _set_cpu_affinity(self.pid, cpus)
+        for child in descendants:
+            _set_cpu_affinity(child.pid, cpus)
 
     def kill(self):
-        """Kill the process if it's running."""
+        """Kill the process if it's running.
+
+        Waits until the process was reaped, but not for its output to be
+        captured. It can be called from output callbacks too.
+        """
         try:
-            if self._process is not None:
+            if self._immutable:
                 kill(self.pid)
-                self._wait_thread.join()
-                self._process = None
                 return True
-            elif self._immutable:
+            elif self.is_running:
                 kill(self.pid)
+                # The hub thread itself reaps the process.
+                if not Hub().is_hub_thread():
+                    self._exited.wait()
                 return True
             else:
                 return None
         except OSError:
             return False
 
-    def wait(self, timeout: Optional[int] = None):
+    def wait(self, timeout: Optional[float] = None):
         """Wait for the process to finish.
 
         It will wait for the process to finish running. If the timeout is
         provided, the function will wait only `timeout` amount of seconds and
-        then return to it's caller.
+        then return to it's caller. The wait is woken up as soon as the process
+        exits and its output files are closed, no polling is involved.
+
+        With `pipe` capture the process has finished once it has exited, all
+        of the output it wrote has been captured and the output callbacks
+        were called with it. Descendants that inherited the pipes, e.g.
+        commands started in the background, don't delay it. Their output is
+        captured as long as they keep running, but it may arrive after
+        `wait` has returned.
 
         Args:
             timeout: `None` if you want to wait to wait until the process
                 actually finishes, otherwise it will wait just the `timeout`
-                number of seconds.
+                number of seconds. Fractions of a second are supported.
 
         Returns:
             bool: Return value only makes sense if you provided the timeout
                 parameter. It will indicate if the process actually finished in
                 the amount of time specified, i.e. if the we specify 3 seconds
                 and the process actually stopped after 3 seconds it will return
-                `True` otherwise it will return `False`.
+                `True` otherwise it will return `False`. With `pipe` capture
+                `False` can also mean that the process has exited, but its
+                output callbacks are still running.
         """
         if self._immutable:
             raise NotImplementedError
 
-        if timeout is not None:
-            current_time = time.time()
-            while time.time() - current_time < (timeout * 1000):
-                if not self.is_running:
-                    return True
-                time.sleep(0.1)
-            return False
-        else:
-            while self.is_running:
-                time.sleep(0.1)
+        if self._process is None:
             return True
+        return self._finished.wait(timeout)
 
     @property
     def is_running(self):
@@ -320,6 +940,10 @@ class Process:
     def exit_code(self) -> Optional[int]:
         """Exit code if the process has finished running.
 
+        The exit code is available as soon as the process was reaped, with
+        `pipe` capture it can be set before `wait` returns, while the output
+        is still being captured.
+
         Returns:
             Optional[int]: Exit code or `None` if the process is still running.
         """
@@ -330,6 +954,27 @@ class Process:
             return None
         return self._process.returncode
 
+    @property
+    def timed_out(self) -> bool:
+        """`True` if the process was terminated because of its timeout."""
+        return self._timed_out
+
+    @property
+    def rusage(self) -> Optional[ResourceUsage]:
+        """Resource usage of the process once it has finished.
+
+        Returns:
+            Optional[ResourceUsage]: CPU times, maximum RSS, context switches
+                and start and end timestamps, or `None` if the process is
+                still running or the usage couldn't be collected.
+        """
+        if self._immutable:
+            raise NotImplementedError
+
+        if self.is_running:
+            return None
+        return self._rusage
+
     def write(self, string: str):
         """Write a string to the process standard input.
 
@@ -345,6 +990,174 @@ class Process:
             self._process.stdin.write(string.encode(self._encoding))
             self._process.stdin.flush()
 
+    def __stdin(self):
+        if self._immutable:
+            raise NotImplementedError
+        if not self._redirect_output or self._process is None:
+            return None
+        return self._process.stdin
+
+    @staticmethod
+    def __write_batched(
+        stdin, chunks: Iterable[bytes], chunk_size: int
+    ) -> int:
+        # Join small chunks, so every write syscall moves `chunk_size` bytes.
+        written = 0
+        batch = bytearray()
+        for chunk in chunks:
+            if not batch and len(chunk) >= chunk_size:
+                stdin.write(chunk)
+                written += len(chunk)
+                continue
+            batch += chunk
+            if len(batch) >= chunk_size:
+                stdin.write(batch)
+                written += len(batch)
+                batch = bytearray()
+        if batch:
+            stdin.write(batch)
+            written += len(batch)
+        stdin.flush()
+        return written
+
+    @staticmethod
+    def __sendfile(stdin, source: IO, chunk_size: int) -> Optional[int]:
+        # Copy a regular file into the pipe in the kernel. Returns `None` if
+        # the source can't be sent this way.
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            fd = source.fileno()
+            if not stat.S_ISREG(os.fstat(fd).st_mode):
+                return None
+            offset = source.tell()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+        stdin.flush()
+        written = 0
+        while True:
+            try:
+                sent = os.sendfile(
+                    stdin.fileno(), fd, offset + written, chunk_size
+                )
+            except OSError as e:
+                if written == 0 and e.errno in (errno.EINVAL, errno.ENOSYS):
+                    return None
+                raise
+            if sent == 0:
+                break
+            written += sent
+        source.seek(offset + written)
+        return written
+
+    def write_bytes(self, data: bytes, flush: bool = True):
+        """Write raw bytes to the process standard input.
+
+        Unlike `write` nothing is appended to the data.
+
+        Args:
+            data: Bytes to write.
+            flush: Flush the input buffer. Pass `False` when writing a lot of
+                small pieces, and flush with the last one or `close_stdin`.
+        """
+        stdin = self.__stdin()
+        if stdin is not None:
+            stdin.write(data)
+            if flush:
+                stdin.flush()
+
+    def writelines(
+        self, lines: Iterable[str], chunk_size: int = CHUNK_SIZE
+    ) -> int:
+        """Write lines to the process standard input.
+
+        Like `write` a newline is appended to every line that doesn't end
+        with one. Lines are encoded and written in batches of `chunk_size`
+        bytes instead of one write per line.
+
+        Args:
+            lines: Lines to write.
+            chunk_size: Number of bytes written at once.
+
+        Returns:
+            int: Number of bytes written.
+        """
+        stdin = self.__stdin()
+        if stdin is None:
+            return 0
+        encoding = self._encoding
+        return self.__write_batched(
+            stdin,
+            (
+                (line if line.endswith("\n") else line + "\n").encode(
+                    encoding
+                )
+                for line in lines
+            ),
+            chunk_size,
+        )
+
+    def feed_from(
+        self,
+        source: Union[IO, Iterable[Union[bytes, str]]],
+        chunk_size: int = CHUNK_SIZE,
+    ) -> int:
+        """Copy all the data from a file or an iterable to the standard input.
+
+        The call blocks while the pipe is full, so the data is produced only
+        as fast as the process consumes it. Binary files are read in chunks
+        of `chunk_size` bytes, regular files are copied by the kernel with
+        `sendfile` on Linux. Iterables can yield bytes or strings, which are
+        encoded, and small items are batched into `chunk_size` writes.
+
+        Args:
+            source: Binary file object or an iterable of bytes or strings.
+            chunk_size: Number of bytes written at once.
+
+        Returns:
+            int: Number of bytes written.
+
+        Raises:
+            BrokenPipeError: If the process closed its standard input.
+        """
+        stdin = self.__stdin()
+        if stdin is None:
+            return 0
+        if hasattr(source, "read"):
+            written = self.__sendfile(stdin, source, chunk_size)
+            if written is not None:
+                return written
+            chunks = iter(lambda: source.read(chunk_size), b"")
+        else:
+            encoding = self._encoding
+            chunks = (
+                item.encode(encoding) if isinstance(item, str) else item
+                for item in source
+            )
+        return self.__write_batched(stdin, chunks, chunk_size)
+
+    def close_stdin(self):
+        """Flush and close the standard input, the process will see EOF."""
+        stdin = self.__stdin()
+        if stdin is not None and not stdin.closed:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def __reader(self, stderr: bool):
+        if self._immutable:
+            raise NotImplementedError
+        if not self._redirect_output or (stderr and not self._demux):
+            return None
+        return self._stderr_reader if stderr else self._stdout_reader
+
+    def __decode(self, data: bytes, stderr: bool) -> str:
+        # Incremental decoders keep incomplete multi-byte characters between
+        # reads instead of failing on them.
+        decoder = self._stderr_decoder if stderr else self._stdout_decoder
+        return decoder.decode(data, final=self._finished.is_set())
+
     def read(self) -> str:
         """Read from the process standard output.
 
@@ -353,11 +1166,9 @@ class Process:
                 written anything. If it hasn't or you already read all the data
                 process wrote, it will return an empty string.
         """
-        if self._immutable:
-            raise NotImplementedError
-
-        if self._redirect_output:
-            return self._stdout_reader.read().decode(self._encoding)
+        reader = self.__reader(stderr=False)
+        if reader is not None:
+            return self.__decode(reader.read(), stderr=False)
         return ""
 
     def eread(self) -> str:
@@ -368,12 +1179,182 @@ class Process:
                 written anything. If it hasn't or you already read all the data
                 process wrote, it will return an empty string.
         """
+        reader = self.__reader(stderr=True)
+        if reader is not None:
+            return self.__decode(reader.read(), stderr=True)
+        return ""
+
+    def read_bytes(self, n: int = -1, stderr: bool = False) -> bytes:
+        """Read raw bytes from the process output without decoding them.
+
+        Shares the read position with `read` and `eread`.
+
+        Args:
+            n: Maximum number of bytes to read. If negative, all the data that
+                was not read yet is returned.
+            stderr: Read from the standard error instead of the standard
+                output.
+
+        Returns:
+            bytes: Data that was not read yet, or an empty bytes object.
+        """
+        reader = self.__reader(stderr)
+        if reader is not None:
+            return reader.read(n)
+        return b""
+
+    def readline(self, stderr: bool = False) -> bytes:
+        """Read the next complete line from the process output.
+
+        Shares the read position with `read` and `eread`.
+
+        Args:
+            stderr: Read from the standard error instead of the standard
+                output.
+
+        Returns:
+            bytes: The line including the line ending. While the process is
+                running an empty bytes object is returned if there is no
+                complete line yet. After it finished the last line is returned
+                even if it doesn't end with a new line.
+        """
+        reader = self.__reader(stderr)
+        if reader is None:
+            return b""
+        if isinstance(reader, PipeBuffer):
+            return reader.readline()
+        position = reader.tell()
+        line = reader.readline()
+        if not line.endswith(b"\n") and not self._finished.is_set():
+            reader.seek(position)
+            return b""
+        return line
+
+    def read_since(self, offset: int, stderr: bool = False) -> bytes:
+        """Read the process output starting at `offset`.
+
+        Doesn't use or move the read position, so it can be used to tail the
+        output of a long running process by keeping track of the offset.
+
+        Args:
+            offset: Offset in bytes from the start of the output.
+            stderr: Read from the standard error instead of the standard
+                output.
+
+        Returns:
+            bytes: All the data written after `offset`.
+        """
+        reader = self.__reader(stderr)
+        if reader is None:
+            return b""
+        if isinstance(reader, PipeBuffer):
+            return reader.read_since(offset)
+        fd = reader.fileno()
+        size = os.fstat(fd).st_size - offset
+        if size <= 0:
+            return b""
+        return os.pread(fd, size, offset)
+
+    def __view(self, stderr: bool) -> Union[mmap.mmap, bytes]:
+        reader = self.__reader(stderr)
+        if reader is None:
+            return b""
+        if isinstance(reader, PipeBuffer):
+            raise ProcessError("Output views require `file` capture")
+        fd = reader.fileno()
+        if os.fstat(fd).st_size == 0:
+            # Empty files can't be mapped
+            return b""
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+    def stdout_view(self) -> Union[mmap.mmap, bytes]:
+        """Read only memory mapped view of the captured standard output.
+
+        The view covers the whole capture file, independent of the read
+        position, and the data is paged in by the OS only when it's accessed.
+        It supports slicing, `find`, `re` and `memoryview` without copying
+        the output into memory. Only the output written when the view was
+        created is visible, so create it after `wait` to see all of it.
+
+        Returns:
+            Union[mmap.mmap, bytes]: The view, or an empty bytes object if
+                nothing was written.
+
+        Raises:
+            ProcessError: If the output is captured with `pipe` capture.
+        """
+        return self.__view(stderr=False)
+
+    def stderr_view(self) -> Union[mmap.mmap, bytes]:
+        """Read only memory mapped view of the captured standard error.
+
+        Same as `stdout_view` for the standard error.
+
+        Returns:
+            Union[mmap.mmap, bytes]: The view, or an empty bytes object if
+                nothing was written.
+
+        Raises:
+            ProcessError: If the output is captured with `pipe` capture.
+        """
+        return self.__view(stderr=True)
+
+    @property
+    def stdout_dropped(self) -> int:
+        """Number of standard output bytes dropped by `capture_limit`."""
+        if isinstance(self._stdout_reader, PipeBuffer):
+            return self._stdout_reader.dropped
+        return 0
+
+    @property
+    def stderr_dropped(self) -> int:
+        """Number of standard error bytes dropped by `capture_limit`."""
+        if isinstance(self._stderr_reader, PipeBuffer):
+            return self._stderr_reader.dropped
+        return 0
+
+    def __pipe_buffer(self, stderr: bool) -> PipeBuffer:
         if self._immutable:
             raise NotImplementedError
+        if not self._redirect_output or self._capture != "pipe":
+            raise ProcessError("Output iteration requires `pipe` capture")
+        if stderr and not self._demux:
+            raise ProcessError("Standard error is not demuxed")
+        return self._stderr_reader if stderr else self._stdout_reader
 
-        if self._redirect_output and self._demux:
-            return self._stderr_reader.read().decode("utf-8")
-        return ""
+    def iter_chunks(
+        self, stderr: bool = False
+    ) -> Generator[bytes, None, None]:
+        """Iterate over the raw output while the process is running.
+
+        Chunks are yielded as soon as they are read from the pipe and the
+        iteration stops when the pipe is closed. That can be after the
+        process has finished, if descendants inherited its output. Data
+        yielded here won't be returned by `read` or `eread` any more.
+
+        Args:
+            stderr: Iterate over the standard error instead of the standard
+                output.
+        """
+        return self.__pipe_buffer(stderr).iter_chunks()
+
+    def iter_lines(self, stderr: bool = False) -> Generator[str, None, None]:
+        """Iterate over decoded output lines while the process is running.
+
+        Lines keep their line endings, the last line may not have one.
+
+        Args:
+            stderr: Iterate over the standard error instead of the standard
+                output.
+        """
+        pending = b""
+        for chunk in self.__pipe_buffer(stderr).iter_chunks():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield (line + b"\n").decode(self._encoding)
+        if pending:
+            yield pending.decode(self._encoding)
 
     def __del__(self):
         self.__close_files()
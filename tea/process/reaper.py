@@ -0,0 +1,182 @@
+"""Process wide reaper of child processes.
+
+On Linux every child is tracked with a pidfd registered in the selector of
+the shared `Hub`, so the number of threads stays constant regardless of the
+number of running children. On platforms without pidfd support the children
+are reaped by a single `Reaper` thread instead.
+
+Children are reaped with `os.wait4`, so their resource usage is collected
+together with the exit status.
+"""
+
+import os
+import time
+import logging
+import threading
+import resource
+import subprocess
+from typing import Callable, Optional
+
+from tea.dsa.singleton import Singleton
+from tea.process.hub import Hub
+
+
+logger = logging.getLogger(__name__)
+
+# How often registered children are polled when the reaper can't block.
+_POLL_INTERVAL = 0.05
+
+
+def _returncode(status: int) -> int:
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def reap(process: subprocess.Popen) -> Optional[resource.struct_rusage]:
+    """Wait for the child to exit, set its return code and get its rusage.
+
+    Returns:
+        Resource usage of the child or `None` if it was already reaped
+        somewhere else.
+    """
+    if process.returncode is not None:
+        return None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return None
+    process.returncode = _returncode(status)
+    return rusage
+
+
+Callback = Callable[[Optional[resource.struct_rusage]], None]
+
+
+def _waitable(pid: int) -> bool:
+    # `True` if the child `pid` has exited and is still waiting to be reaped.
+    try:
+        flags = os.WEXITED | os.WNOHANG | os.WNOWAIT
+        return os.waitid(os.P_PID, pid, flags) is not None
+    except ChildProcessError:
+        return False
+
+
+class Reaper(Singleton):
+    """Reap registered children from a single background thread.
+
+    The thread blocks in `os.waitid` until any child has exited, without
+    reaping it, and reaps it only if it was registered. Children started by
+    other code are left to it: while one of them is waiting to be reaped, and
+    where `os.waitid` is not available, the registered children are polled
+    instead.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._children = {}
+        self._thread = threading.Thread(
+            target=self._run, name="tea-reaper", daemon=True
+        )
+        self._thread.start()
+
+    def add_child(self, process: subprocess.Popen, callback: Callback):
+        """Call `callback` from the reaper thread once `process` was reaped.
+
+        The callback receives the resource usage of the child, or `None` if
+        it's not available, and must not block.
+        """
+        with self._condition:
+            self._children[process.pid] = (process, callback)
+            self._condition.notify()
+
+    @property
+    def size(self) -> int:
+        """Number of children that weren't reaped yet."""
+        with self._condition:
+            return len(self._children)
+
+    def __poll(self, pid: int):
+        # Reap the registered child `pid` and call its callback if it has
+        # exited.
+        with self._condition:
+            process, callback = self._children[pid]
+        rusage = None
+        if process.returncode is None:
+            try:
+                reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+            except ChildProcessError:
+                # Reaped somewhere else.
+                process.wait()
+            else:
+                if reaped == 0:
+                    return
+                process.returncode = _returncode(status)
+        with self._condition:
+            del self._children[pid]
+        try:
+            callback(rusage)
+        except Exception:
+            logger.exception("Reaper callback failed.")
+
+    def _run(self):
+        # Exited child that is not registered and not reaped yet.
+        foreign = None
+        while True:
+            with self._condition:
+                while not self._children:
+                    self._condition.wait()
+                pids = list(self._children)
+            if foreign is not None and not _waitable(foreign):
+                foreign = None
+            if foreign is not None or not hasattr(os, "waitid"):
+                for pid in pids:
+                    self.__poll(pid)
+                time.sleep(_POLL_INTERVAL)
+                continue
+            try:
+                info = os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                # The registered children were reaped somewhere else.
+                info = None
+            if info is None:
+                for pid in pids:
+                    self.__poll(pid)
+                continue
+            with self._condition:
+                registered = info.si_pid in self._children
+            if registered:
+                self.__poll(info.si_pid)
+            else:
+                foreign = info.si_pid
+
+
+def watch(process: subprocess.Popen, callback: Callback):
+    """Call `callback` after the child `process` has exited and was reaped.
+
+    Args:
+        process: Child process to watch.
+        callback: Callable that receives the child's resource usage, or
+            `None` if it's not available. It's called from a background
+            thread and must not block.
+    """
+    if Hub.pidfd_supported():
+        try:
+            Hub().add_child(process.pid, lambda: callback(reap(process)))
+            return
+        except OSError:
+            logger.debug("pidfd_open failed, falling back to the reaper.")
+    Reaper().add_child(process, callback)
+
+
+def _reset_after_fork():
+    # Threads don't survive a fork, the child has to create its own reaper.
+    Reaper._instance = None
+    Reaper._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
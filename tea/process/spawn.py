@@ -0,0 +1,152 @@
+"""Start child processes with :func:`os.posix_spawn`.
+
+`subprocess.Popen` forks the parent on older pythons and on non-Linux
+platforms, which gets expensive when the parent has a large resident set.
+`os.posix_spawn` avoids copying the parent's page tables. Since python 3.10
+`subprocess` itself uses `vfork` on Linux, so there the `fork` strategy is
+just as fast and `auto` keeps using it.
+"""
+
+import io
+import os
+import sys
+import signal
+import shutil
+import subprocess
+from typing import Dict, List, Optional
+
+from tea.process.reaper import _returncode
+
+SPAWN_STRATEGIES = ("auto", "posix_spawn", "fork")
+
+# Signals ignored by python that `subprocess.Popen` resets in the child, so
+# for example the stages of a pipeline are killed by SIGPIPE.
+_RESTORE_SIGNALS = tuple(
+    getattr(signal, name)
+    for name in ("SIGPIPE", "SIGXFZ", "SIGXFSZ")
+    if hasattr(signal, name)
+)
+
+_POPEN_USES_VFORK = (
+    sys.platform.startswith("linux") and sys.version_info >= (3, 10)
+)
+
+
+def use_posix_spawn(strategy: str, working_dir: Optional[str]) -> bool:
+    """Decide if a process should be started with `posix_spawn`.
+
+    Falls back to fork when `posix_spawn` is not available or when the process
+    needs a feature `posix_spawn` can't express, like changing the working
+    directory.
+
+    Args:
+        strategy: One of `auto`, `posix_spawn` or `fork`.
+        working_dir: Working directory of the new process.
+    """
+    if strategy == "fork" or not hasattr(os, "posix_spawn"):
+        return False
+    if working_dir is not None:
+        return False
+    return strategy == "posix_spawn" or not _POPEN_USES_VFORK
+
+
+class SpawnedProcess:
+    """Minimal `subprocess.Popen` compatible handle of a spawned child."""
+
+    def __init__(self, pid: int, stdin=None, stdout=None, stderr=None):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid == self.pid:
+                self.returncode = _returncode(status)
+        return self.returncode
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = _returncode(status)
+        return self.returncode
+
+
+def _find_executable(command: str, env: Optional[Dict[str, str]]) -> str:
+    # Same as subprocess, search the PATH of the child environment.
+    if os.path.dirname(command):
+        return command
+    path = (env if env is not None else os.environ).get("PATH", os.defpath)
+    executable = shutil.which(command, path=path)
+    if executable is None:
+        raise FileNotFoundError(f"No such file or directory: {command}")
+    return executable
+
+
+def _fileno(f) -> int:
+    return f if isinstance(f, int) else f.fileno()
+
+
+def posix_spawn(
+    commandline: List[str],
+    stdin=None,
+    stdout=None,
+    stderr=None,
+    env: Optional[Dict[str, str]] = None,
+    start_new_session: bool = False,
+) -> SpawnedProcess:
+    """Start a process with `os.posix_spawn`.
+
+    Standard streams accept the same values as `subprocess.Popen`: `None` to
+    inherit the parent's stream, `subprocess.PIPE`, a file object or a file
+    descriptor. `stderr` also accepts `subprocess.STDOUT`.
+
+    Raises:
+        OSError: If the process can't be started.
+    """
+    executable = _find_executable(commandline[0], env)
+    file_actions = []
+    # File descriptors that are closed in the parent after the spawn.
+    child_ends = []
+    parent_ends = {}
+    try:
+        if stdin == subprocess.PIPE:
+            read, write = os.pipe()
+            child_ends.append(read)
+            parent_ends["stdin"] = io.open(write, "wb")
+            stdin = read
+        if stdout == subprocess.PIPE:
+            read, write = os.pipe()
+            child_ends.append(write)
+            parent_ends["stdout"] = io.open(read, "rb")
+            stdout = write
+        if stderr == subprocess.PIPE:
+            read, write = os.pipe()
+            child_ends.append(write)
+            parent_ends["stderr"] = io.open(read, "rb")
+            stderr = write
+        elif stderr == subprocess.STDOUT:
+            stderr = 1 if stdout is None else stdout
+        for target, f in enumerate((stdin, stdout, stderr)):
+            if f is not None:
+                file_actions.append(
+                    (os.POSIX_SPAWN_DUP2, _fileno(f), target)
+                )
+        pid = os.posix_spawn(
+            executable,
+            commandline,
+            os.environ if env is None else env,
+            file_actions=file_actions,
+            setsid=start_new_session,
+            setsigdef=_RESTORE_SIGNALS,
+        )
+    except BaseException:
+        for f in parent_ends.values():
+            f.close()
+        raise
+    finally:
+        for fd in child_ends:
+            os.close(fd)
+    return SpawnedProcess(pid, **parent_ends)
@@ -0,0 +1,259 @@
+"""Indexed snapshot of the running processes."""
+
+import os
+import re
+import time
+import logging
+import threading
+from operator import attrgetter
+from typing import Dict, List, Optional, Set
+
+import psutil
+
+from tea.process.wrappers import ProcessInfo
+
+
+logger = logging.getLogger(__name__)
+
+_PROC = os.path.isdir("/proc/self")
+_BOOT_TIME = None
+
+
+def _create_time(pid: int) -> Optional[float]:
+    """Creation time of a process or `None` if it's gone.
+
+    On Linux it's read directly from `/proc/<pid>/stat`, which is a lot
+    cheaper than creating a `psutil.Process` for every PID on every refresh.
+    """
+    global _BOOT_TIME
+
+    if not _PROC:
+        try:
+            return psutil.Process(pid).create_time()
+        except psutil.Error:
+            return None
+    try:
+        fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        data = os.read(fd, 4096)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    # The command name in parentheses can contain spaces, the start time is
+    # the 22nd field.
+    ticks = int(data[data.rindex(b")") + 2 :].split(b" ", 20)[19])
+    if _BOOT_TIME is None:
+        _BOOT_TIME = psutil.boot_time()
+    return _BOOT_TIME + ticks / os.sysconf("SC_CLK_TCK")
+
+
+class ProcessTable:
+    """Snapshot of the running processes indexed by command and arguments.
+
+    Refreshing the table only reads the command lines of processes that
+    appeared since the last refresh and drops the ones that are gone, so
+    frequent lookups are cheap even on hosts with a lot of processes. The
+    creation time of every process is checked on refresh, so a PID reused by
+    a new process between two refreshes is read again.
+
+    Lookups with `exact=True` are plain index lookups. Other lookups are
+    substring searches over all indexed names and arguments.
+
+    Usage::
+
+        >>> table = ProcessTable(max_age=1)
+        >>> table.find('python', 'manage.py')
+        ProcessInfo(pid=1234, command=/usr/bin/python)
+
+    Args:
+        max_age: If set, lookups refresh the table automatically when it's
+            older than `max_age` seconds. Otherwise `refresh` has to be called
+            explicitly.
+    """
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._max_age = max_age
+        self._refreshed = None
+        self._lock = threading.RLock()
+        self._processes: Dict[int, ProcessInfo] = {}
+        # Processes without a command line (e.g. kernel threads) -> their
+        # creation time
+        self._skipped: Dict[int, Optional[float]] = {}
+        # Lowercase command -> pids
+        self._by_command: Dict[str, Set[int]] = {}
+        # Lowercase command and its base name -> pids
+        self._by_name: Dict[str, Set[int]] = {}
+        # Lowercase command line token -> pids
+        self._by_token: Dict[str, Set[int]] = {}
+
+    def __len__(self):
+        return len(self._processes)
+
+    @staticmethod
+    def __index(index: Dict[str, Set[int]], key: str, pid: int):
+        index.setdefault(key, set()).add(pid)
+
+    @staticmethod
+    def __unindex(index: Dict[str, Set[int]], key: str, pid: int):
+        pids = index.get(key)
+        if pids is not None:
+            pids.discard(pid)
+            if not pids:
+                del index[key]
+
+    @staticmethod
+    def __names(command: str) -> Set[str]:
+        command = command.lower()
+        return {command, os.path.basename(command)}
+
+    def __add(self, pid: int):
+        create_time = _create_time(pid)
+        try:
+            p = psutil.Process(pid)
+            try:
+                cmdline = p.cmdline()
+            except psutil.AccessDenied:
+                cmdline = [p.exe()]
+        except psutil.Error:
+            cmdline = None
+        if not cmdline or not cmdline[0]:
+            self._skipped[pid] = create_time
+            return
+        info = ProcessInfo(pid, cmdline, create_time)
+        self._processes[pid] = info
+        self.__index(self._by_command, info.command.lower(), pid)
+        for name in self.__names(info.command):
+            self.__index(self._by_name, name, pid)
+        for token in cmdline:
+            self.__index(self._by_token, token.lower(), pid)
+
+    def __remove(self, pid: int):
+        info = self._processes.pop(pid)
+        self.__unindex(self._by_command, info.command.lower(), pid)
+        for name in self.__names(info.command):
+            self.__unindex(self._by_name, name, pid)
+        for token in info.command_line:
+            self.__unindex(self._by_token, token.lower(), pid)
+
+    def refresh(self):
+        """Bring the table up to date by diffing the set of running PIDs.
+
+        PIDs that are still running but belong to a process created after
+        the one in the table were reused, they are read again.
+        """
+        pids = set(psutil.pids())
+        with self._lock:
+            for pid in list(self._skipped):
+                if pid not in pids or (
+                    _create_time(pid) != self._skipped[pid]
+                ):
+                    del self._skipped[pid]
+            for pid in list(self._processes):
+                if pid not in pids or (
+                    _create_time(pid)
+                    != self._processes[pid].create_time
+                ):
+                    self.__remove(pid)
+            known = set(self._processes) | set(self._skipped)
+            for pid in pids - known:
+                self.__add(pid)
+            self._refreshed = time.monotonic()
+
+    def __ensure_fresh(self):
+        if self._refreshed is None or (
+            self._max_age is not None
+            and time.monotonic() - self._refreshed > self._max_age
+        ):
+            self.refresh()
+
+    def __lookup(self, index: Dict[str, Set[int]], match) -> Set[int]:
+        pids = set()
+        for key, key_pids in index.items():
+            if match(key):
+                pids |= key_pids
+        return pids
+
+    def __select(self, commands: Set[int], tokens: Optional[Set[int]]):
+        pids = commands if tokens is None else commands & tokens
+        return sorted(
+            (self._processes[pid] for pid in pids),
+            key=attrgetter("command", "pid"),
+        )
+
+    def find_all(
+        self, name: str, arg: Optional[str] = None, exact: bool = False
+    ):
+        """Find all processes by name and optionally by argument.
+
+        Matching is the same as in :func:`tea.process.find`: a case
+        insensitive substring search.
+
+        Args:
+            name: Process name to search for.
+            arg: Command line argument for a process to search for.
+            exact: Only match processes whose command or its base name is
+                `name` and that have the argument `arg`, case insensitively.
+                Looks the processes up in the index instead of searching.
+
+        Returns:
+            List[ProcessInfo]: Matching processes sorted by name and PID.
+        """
+        name = name.lower()
+        if arg is not None:
+            arg = arg.lower()
+        with self._lock:
+            self.__ensure_fresh()
+            tokens = None
+            if exact:
+                commands = self._by_name.get(name, set())
+                if arg is not None:
+                    tokens = self._by_token.get(arg, set())
+                return self.__select(commands, tokens)
+            commands = self.__lookup(self._by_command, lambda c: name in c)
+            if arg is not None:
+                tokens = self.__lookup(self._by_token, lambda t: arg in t)
+            return self.__select(commands, tokens)
+
+    def find(
+        self, name: str, arg: Optional[str] = None, exact: bool = False
+    ) -> Optional[ProcessInfo]:
+        """Find the first process by name and optionally by argument.
+
+        Args:
+            name: Process name to search for.
+            arg: Command line argument for a process to search for.
+            exact: Match the name and the argument exactly, see `find_all`.
+
+        Returns:
+            Optional[ProcessInfo]: Process if found.
+        """
+        processes = self.find_all(name, arg, exact)
+        return processes[0] if processes else None
+
+    def find_by_regex(
+        self, pattern: str, arg_pattern: Optional[str] = None
+    ) -> List[ProcessInfo]:
+        """Find all processes whose command matches a regular expression.
+
+        Expressions are matched case insensitively.
+
+        Args:
+            pattern: Regular expression searched for in the command.
+            arg_pattern: Optional regular expression that has to be found in
+                at least one of the command line arguments.
+
+        Returns:
+            List[ProcessInfo]: Matching processes sorted by name and PID.
+        """
+        regex = re.compile(pattern, re.IGNORECASE)
+        with self._lock:
+            self.__ensure_fresh()
+            commands = self.__lookup(self._by_command, regex.search)
+            tokens = None
+            if arg_pattern is not None:
+                arg_regex = re.compile(arg_pattern, re.IGNORECASE)
+                tokens = self.__lookup(self._by_token, arg_regex.search)
+            return self.__select(commands, tokens)
@@ -0,0 +1,144 @@
+"""Process wide scheduler for process timeouts.
+
+All timeouts are handled by a single background thread that sleeps until the
+earliest deadline, so enforcing timeouts doesn't add a thread per process.
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Optional
+
+from tea.dsa.singleton import Singleton
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """Handle of a scheduled callback."""
+
+    __slots__ = ("deadline", "callback", "cancelled", "_watchdog")
+
+    def __init__(
+        self,
+        deadline: float,
+        callback: Callable[[], None],
+        watchdog: Optional["Watchdog"] = None,
+    ):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+        # Set while the timer is in the heap of the watchdog.
+        self._watchdog = watchdog
+
+    def cancel(self):
+        """Cancel the callback if it wasn't already called.
+
+        The reference to the callback is dropped immediately, so whatever it
+        refers to isn't kept alive until the deadline.
+        """
+        watchdog = self._watchdog
+        if watchdog is None:
+            self.cancelled = True
+            self.callback = None
+            return
+        with watchdog._condition:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.callback = None
+            if self._watchdog is not None:
+                watchdog._discard()
+
+
+class Watchdog(Singleton):
+    """Call callbacks after a delay from a single background thread."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._timers = []
+        # Number of cancelled timers still in the heap.
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        """Call `callback` after `delay` seconds.
+
+        Args:
+            delay: Delay in seconds.
+            callback: Callable without arguments. It's called from the
+                watchdog thread, so it should not block.
+
+        Returns:
+            Timer: Handle that can be used to cancel the callback.
+        """
+        timer = Timer(time.monotonic() + delay, callback, self)
+        with self._condition:
+            heapq.heappush(
+                self._timers, (timer.deadline, next(self._counter), timer)
+            )
+            self._condition.notify()
+        return timer
+
+    @property
+    def size(self) -> int:
+        """Number of timers in the heap, including cancelled ones."""
+        with self._condition:
+            return len(self._timers)
+
+    def _discard(self):
+        # Called with the condition held when a timer in the heap is
+        # cancelled. The heap is rebuilt once it's mostly cancelled timers,
+        # so timers cancelled long before their deadline don't pile up.
+        self._cancelled += 1
+        if self._cancelled * 2 > len(self._timers):
+            self._timers = [t for t in self._timers if not t[2].cancelled]
+            heapq.heapify(self._timers)
+            self._cancelled = 0
+
+    def __pop(self) -> Timer:
+        timer = heapq.heappop(self._timers)[2]
+        timer._watchdog = None
+        if timer.cancelled:
+            self._cancelled -= 1
+        return timer
+
+    def _next(self) -> Timer:
+        with self._condition:
+            while True:
+                while self._timers and self._timers[0][2].cancelled:
+                    self.__pop()
+                if not self._timers:
+                    self._condition.wait()
+                    continue
+                delay = self._timers[0][0] - time.monotonic()
+                if delay <= 0:
+                    return self.__pop()
+                self._condition.wait(delay)
+
+    def _run(self):
+        while True:
+            timer = self._next()
+            callback = timer.callback
+            if timer.cancelled or callback is None:
+                continue
+            try:
+                callback()
+            except Exception:
+                logger.exception("Watchdog callback failed.")
+
+
+def _reset_after_fork():
+    # Threads don't survive a fork, the child has to create its own watchdog.
+    Watchdog._instance = None
+    Watchdog._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
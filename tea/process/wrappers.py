@@ -1,77 +1,388 @@
 import os
+import re
+import json
+import time
+import hashlib
 import logging
-from functools import cmp_to_key
-from typing import List, Generator, Tuple, Union, Dict, Optional
+import tempfile
+import itertools
+import threading
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import (
+    List,
+    Generator,
+    Tuple,
+    Union,
+    Dict,
+    Optional,
+    Iterable,
+    Callable,
+    TYPE_CHECKING,
+)
 
 import psutil
 
-from tea.utils import cmp
-from tea.process.process import Process
+from tea.process.process import (
+    ExecutableNotFound,
+    Process,
+    ProcessError,
+    ProcessTimeout,
+    ResourceUsage,
+    kill,
+)
+from tea.process.pipeline import Pipeline
+
+if TYPE_CHECKING:
+    from tea.process.table import ProcessTable
 
 
 logger = logging.getLogger(__name__)
 
+# Names of the files `ResultCache` writes.
+_RESULT_NAME = re.compile(r"[0-9a-f]{64}\.json")
+_TMP_PREFIX = "tea-result-"
+# Temporary files older than this are left over from interrupted writes.
+_TMP_MAX_AGE = 3600
+
+
+class ProcessInfo:
+    """Lightweight read only information about a running process.
+
+    Used for process listing instead of the full `Process` class, so listing
+    doesn't allocate any output capture state. `create_time` is the process
+    creation time, if known, and tells processes that reused a PID apart.
+    """
+
+    __slots__ = ("pid", "command_line", "create_time")
+
+    def __init__(
+        self,
+        pid: int,
+        command_line: List[str],
+        create_time: Optional[float] = None,
+    ):
+        self.pid = pid
+        self.command_line = command_line
+        self.create_time = create_time
 
-def _list_processes() -> Generator:
-    for p in psutil.process_iter():
+    @property
+    def command(self) -> str:
+        """Command."""
+        return self.command_line[0]
+
+    @property
+    def arguments(self) -> List[str]:
+        """Arguments."""
+        return self.command_line[1:]
+
+    def kill(self) -> bool:
+        """Kill the process."""
         try:
-            try:
-                cmdline = p.cmdline()
-            except Exception:
+            kill(self.pid)
+            return True
+        except OSError:
+            return False
+
+    def __str__(self):
+        return f"ProcessInfo(pid={self.pid}, command={self.command})"
+
+    __repr__ = __str__
+
+
+Predicate = Callable[[int, List[str]], bool]
+
+
+def _list_processes(
+    predicate: Optional[Predicate] = None,
+) -> Generator[ProcessInfo, None, None]:
+    # Fetch the command lines of all processes in one pass. Processes whose
+    # command line can't be read fall back to the executable path, kernel
+    # threads without either are skipped.
+    for p in psutil.process_iter(attrs=["cmdline"], ad_value=None):
+        try:
+            cmdline = p.info["cmdline"]
+            if cmdline is None:
                 cmdline = [p.exe()]
-            yield Process.immutable(p.pid, cmdline)
+            if not cmdline or not cmdline[0]:
+                continue
+            if predicate is None or predicate(p.pid, cmdline):
+                yield ProcessInfo(p.pid, cmdline)
         except Exception:
             pass
 
 
-def get_processes(sort_by_name: bool = True) -> List[Process]:
+def get_processes(
+    sort_by_name: bool = True, predicate: Optional[Predicate] = None
+) -> List[ProcessInfo]:
     """Retrieve a list of processes sorted by name.
 
     Args:
         sort_by_name: Sort the list by name or by process ID's.
+        predicate: Optional function that receives the process ID and the
+            command line of a process and returns `True` if the process
+            should be included. It runs before any objects are created.
 
     Returns:
-        List[Process]: List of processes.
+        List[ProcessInfo]: List of processes.
     """
     if sort_by_name:
-        return sorted(
-            _list_processes(),
-            key=cmp_to_key(
-                lambda p1, p2: (
-                    cmp(p1.command, p2.command) or cmp(p1.pid, p2.pid)
-                )
-            ),
-        )
+        key = attrgetter("command", "pid")
     else:
-        return sorted(
-            _list_processes(),
-            key=cmp_to_key(
-                lambda p1, p2: (
-                    cmp(p1.pid, p2.pid) or cmp(p1.command, p2.command)
-                )
-            ),
-        )
+        key = attrgetter("pid", "command")
+    return sorted(_list_processes(predicate), key=key)
 
 
-def find(name: str, arg: Optional[str] = None):
+def find(
+    name: str,
+    arg: Optional[str] = None,
+    table: Optional["ProcessTable"] = None,
+) -> Optional[ProcessInfo]:
     """Find process by name or by argument in command line.
 
     Args:
         name: Process name to search for.
         arg: Command line argument for a process to search for.
+        table: Optional `ProcessTable` to search instead of listing all the
+            processes on the host.
 
     Returns:
-        tea.process.base.IProcess: Process object if found.
+        Optional[ProcessInfo]: Process object if found.
+    """
+    if table is not None:
+        return table.find(name, arg)
+
+    name = name.lower()
+    arg = arg.lower() if arg is not None else None
+
+    def predicate(pid, cmdline):
+        if name not in cmdline[0].lower():
+            return False
+        return arg is None or any(arg in a.lower() for a in cmdline)
+
+    processes = get_processes(predicate=predicate)
+    return processes[0] if processes else None
+
+
+class ResultCache:
+    """On disk cache of `execute` results.
+
+    Results are stored as JSON files in `directory`, one file per result.
+    The key of a result is a hash of the command line, the environment
+    overrides, the selected inherited environment variables, the working
+    directory and the fingerprints of the declared input files. When the
+    total size of the cache exceeds `max_size` bytes the least recently used
+    results are evicted.
+
+    The cache can be shared by multiple processes, results are written
+    atomically. Only the files the cache wrote are counted, evicted or
+    cleared, other files in `directory` are left alone. Temporary files left
+    over from interrupted writes are removed once they are an hour old.
+
+    Usage::
+
+        >>> cache = ResultCache('/tmp/tea-cache')
+        >>> execute(['gcc', '-E', 'main.c'], cache=cache, inputs=['main.c'])
+        >>> cache.hits, cache.misses
+        (0, 1)
+
+    Args:
+        directory: Directory where the results are stored.
+        max_size: Maximum total size of the stored results in bytes.
+        fingerprint: How input files are fingerprinted, `content` hashes
+            their content and `mtime` uses their modification time and size,
+            which is faster but misses changes that preserve both.
+        cache_failures: Also cache results with a non zero exit code.
     """
-    for p in get_processes():
-        if p.command.lower().find(name.lower()) != -1:
-            if arg is not None:
-                for a in p.command_line or []:
-                    if a.lower().find(arg.lower()) != -1:
-                        return p
-            else:
-                return p
-    return None
+
+    def __init__(
+        self,
+        directory: Union[str, os.PathLike],
+        max_size: int = 256 * 1024 * 1024,
+        fingerprint: str = "content",
+        cache_failures: bool = False,
+    ):
+        if fingerprint not in ("content", "mtime"):
+            raise ProcessError(
+                "fingerprint can be either `content` or `mtime`"
+            )
+        self._directory = os.path.abspath(directory)
+        os.makedirs(self._directory, exist_ok=True)
+        self._max_size = max_size
+        self._fingerprint = fingerprint
+        self._cache_failures = cache_failures
+        self._lock = threading.Lock()
+        self.__remove_orphans()
+        self._size = sum(size for _, size, _ in self.__entries())
+        self.hits = 0
+        self.misses = 0
+
+    def __entries(self):
+        # Yields (path, size, last access) of all stored results.
+        for entry in os.scandir(self._directory):
+            if _RESULT_NAME.fullmatch(entry.name) and entry.is_file():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime_ns
+
+    def __remove_orphans(self):
+        # Writes that are still in progress in other processes are younger.
+        threshold = time.time() - _TMP_MAX_AGE
+        for entry in os.scandir(self._directory):
+            if not (
+                entry.name.startswith(_TMP_PREFIX)
+                and entry.name.endswith(".tmp")
+            ):
+                continue
+            try:
+                if entry.stat().st_mtime < threshold:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.json")
+
+    def __file_fingerprint(self, path: str) -> Optional[str]:
+        try:
+            if self._fingerprint == "mtime":
+                stat = os.stat(path)
+                return f"{stat.st_mtime_ns}:{stat.st_size}"
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def key(
+        self,
+        command: Union[str, List[str]],
+        env: Optional[Dict[str, str]] = None,
+        working_dir: Optional[str] = None,
+        inputs: Iterable[Union[str, os.PathLike]] = (),
+        env_vars: Iterable[str] = (),
+    ) -> str:
+        """Compute the cache key of an invocation.
+
+        Args:
+            command: Command to execute.
+            env: Environment overrides, all of them are part of the key.
+            working_dir: Working directory, defaults to the current one.
+            inputs: Paths of the files the result depends on. Relative paths
+                are resolved against the working directory.
+            env_vars: Names of inherited environment variables the result
+                depends on.
+
+        Returns:
+            str: Hex digest identifying the invocation.
+        """
+        working_dir = os.path.abspath(working_dir or os.getcwd())
+        paths = sorted(
+            os.path.join(working_dir, os.fspath(path)) for path in inputs
+        )
+        description = {
+            "command": [command] if isinstance(command, str) else command,
+            "env": {str(k): str(v) for k, v in (env or {}).items()},
+            "env_vars": {
+                name: os.environ.get(name) for name in sorted(env_vars)
+            },
+            "working_dir": working_dir,
+            "inputs": {path: self.__file_fingerprint(path) for path in paths},
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[int, str, str]]:
+        """Get a stored result and count the hit or the miss.
+
+        Args:
+            key: Key from `key`.
+
+        Returns:
+            Optional[Tuple[int, str, str]]: (exit_code, stdout, stderr) or
+                `None` if the result is not stored.
+        """
+        path = self.__path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Mark the result as recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data["exit_code"], data["stdout"], data["stderr"]
+
+    def put(self, key: str, result: Tuple[int, str, str]):
+        """Store a result.
+
+        Results with a non zero exit code are only stored if
+        `cache_failures` is set.
+
+        Args:
+            key: Key from `key`.
+            result: (exit_code, stdout, stderr)
+        """
+        exit_code, stdout, stderr = result
+        if exit_code != 0 and not self._cache_failures:
+            return
+        data = json.dumps(
+            {"exit_code": exit_code, "stdout": stdout, "stderr": stderr}
+        ).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(
+            dir=self._directory, prefix=_TMP_PREFIX, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.__path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            self._size += len(data)
+            if self._size > self._max_size:
+                self.__evict()
+
+    def __evict(self):
+        # Recount, other processes might share the directory.
+        self.__remove_orphans()
+        entries = sorted(self.__entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self._max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    @property
+    def size(self) -> int:
+        """Total size of the stored results in bytes."""
+        return self._size
+
+    def clear(self):
+        """Remove all stored results and reset the counters."""
+        with self._lock:
+            self.__remove_orphans()
+            for path, _, _ in self.__entries():
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
 
 
 def execute(
@@ -79,7 +390,19 @@ def execute(
     env: Optional[Dict[str, str]] = None,
     working_dir: Optional[str] = None,
     wait: bool = True,
-) -> Union[Tuple[int, str, str], Process]:
+    with_stats: bool = False,
+    timeout: Optional[float] = None,
+    kill_grace: float = 5,
+    cache: Optional[ResultCache] = None,
+    inputs: Iterable[Union[str, os.PathLike]] = (),
+    cache_env: Iterable[str] = (),
+    cpu_affinity: Optional[Iterable[int]] = None,
+    nice: Optional[int] = None,
+    ionice: Optional[Union[str, Tuple[str, int]]] = None,
+    rlimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
+) -> Union[
+    Tuple[int, str, str], Tuple[int, str, str, ResourceUsage], Process
+]:
     """Execute a command with arguments and wait for output.
 
     Arguments should not be quoted!
@@ -89,10 +412,32 @@ def execute(
         env: Environment variables.
         working_dir: Set the working dir.
         wait: Wait for the process to finish.
+        with_stats: Also return the resource usage of the process.
+        timeout: Maximum number of seconds the process is allowed to run.
+            When it's exceeded the whole process tree is terminated.
+        kill_grace: Seconds to wait between `SIGTERM` and `SIGKILL` when the
+            timeout is exceeded.
+        cache: Return the stored result if the same invocation was already
+            executed with unchanged inputs, otherwise store the result in
+            this cache. Can't be combined with `wait=False` and
+            `with_stats`.
+        inputs: Only with `cache`. Paths of the files the result depends on.
+        cache_env: Only with `cache`. Names of inherited environment
+            variables the result depends on.
+        cpu_affinity: CPUs the process is allowed to run on.
+        nice: Niceness increment.
+        ionice: I/O scheduling class or a tuple of the class and the level.
+        rlimits: Resource limits by name, see `Process`.
 
     Returns:
         Tuple[int, str, str]: (exit_code, stdout, stderr) if wait is `True`
-            else the process instance.
+            else the process instance. If `with_stats` is `True` the
+            resource usage is added as the fourth element:
+            (exit_code, stdout, stderr, rusage).
+
+    Raises:
+        ProcessTimeout: If the process was terminated because of the timeout.
+            The exception carries the exit code and the captured output.
 
     Example::
 
@@ -105,11 +450,56 @@ def execute(
         >>> print('status: %s, output: %s, error: %s' % (status, out, err))
         status: 1, output: , error: err
     """
-    process = Process(command=command, env=env, working_dir=working_dir)
+    if cache is not None:
+        if not wait or with_stats:
+            raise ProcessError("cache can't be used with wait or with_stats")
+        key = cache.key(command, env, working_dir, inputs, cache_env)
+        result = cache.get(key)
+        if result is None:
+            result = execute(
+                command,
+                env=env,
+                working_dir=working_dir,
+                timeout=timeout,
+                kill_grace=kill_grace,
+                cpu_affinity=cpu_affinity,
+                nice=nice,
+                ionice=ionice,
+                rlimits=rlimits,
+            )
+            cache.put(key, result)
+        return result
+
+    process = Process(
+        command=command,
+        env=env,
+        working_dir=working_dir,
+        timeout=timeout,
+        kill_grace=kill_grace,
+        cpu_affinity=cpu_affinity,
+        nice=nice,
+        ionice=ionice,
+        rlimits=rlimits,
+    )
     process.start()
     if not wait:
         return process
     process.wait()
+    if process.timed_out:
+        raise ProcessTimeout(
+            command=command,
+            timeout=timeout,
+            exit_code=process.exit_code,
+            stdout=process.read(),
+            stderr=process.eread(),
+        )
+    if with_stats:
+        return (
+            process.exit_code,
+            process.read(),
+            process.eread(),
+            process.rusage,
+        )
     return process.exit_code, process.read(), process.eread()
 
 
@@ -118,6 +508,12 @@ def execute_no_demux(
     env: Optional[Dict[str, str]] = None,
     working_dir: Optional[str] = None,
     wait: bool = True,
+    timeout: Optional[float] = None,
+    kill_grace: float = 5,
+    cpu_affinity: Optional[Iterable[int]] = None,
+    nice: Optional[int] = None,
+    ionice: Optional[Union[str, Tuple[str, int]]] = None,
+    rlimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
 ) -> Union[Tuple[int, str], Process]:
     """Execute a command and return the exit code and output.
 
@@ -126,21 +522,173 @@ def execute_no_demux(
         env: Environment variables.
         working_dir: Set the working dir.
         wait: Wait for the process to finish.
+        timeout: Maximum number of seconds the process is allowed to run.
+            When it's exceeded the whole process tree is terminated.
+        kill_grace: Seconds to wait between `SIGTERM` and `SIGKILL` when the
+            timeout is exceeded.
+        cpu_affinity: CPUs the process is allowed to run on.
+        nice: Niceness increment.
+        ionice: I/O scheduling class or a tuple of the class and the level.
+        rlimits: Resource limits by name, see `Process`.
 
     Returns:
         Tuple[int, str, str]: (exit_code, stdout, stderr) if wait is `True`
             else the process instance.
+
+    Raises:
+        ProcessTimeout: If the process was terminated because of the timeout.
+            The exception carries the exit code and the captured output.
     """
     process = Process(
-        command=command, env=env, working_dir=working_dir, demux=False
+        command=command,
+        env=env,
+        working_dir=working_dir,
+        demux=False,
+        timeout=timeout,
+        kill_grace=kill_grace,
+        cpu_affinity=cpu_affinity,
+        nice=nice,
+        ionice=ionice,
+        rlimits=rlimits,
     )
     process.start()
     if not wait:
         return process
     process.wait()
+    if process.timed_out:
+        raise ProcessTimeout(
+            command=command,
+            timeout=timeout,
+            exit_code=process.exit_code,
+            stdout=process.read(),
+        )
     return process.exit_code, process.read()
 
 
+def execute_pipeline(
+    commands: List[Union[str, List[str]]],
+    env: Optional[Dict[str, str]] = None,
+    working_dir: Optional[str] = None,
+    stdin: Optional[Union[str, os.PathLike]] = None,
+    input: Optional[bytes] = None,
+) -> Tuple[List[int], str, str]:
+    r"""Execute commands connected like a shell pipeline and wait for them.
+
+    Args:
+        commands: Commands of the pipeline stages.
+        env: Environment variables.
+        working_dir: Set the working dir.
+        stdin: Path or file object used as the standard input of the first
+            stage.
+        input: Data written to the standard input of the first stage.
+
+    Returns:
+        Tuple[List[int], str, str]: (exit_codes, stdout, stderr) with the
+            exit codes of all stages and the output of the last one.
+
+    Example::
+
+        >>> execute_pipeline([['printf', 'b\na\n'], ['sort']])
+        ([0, 0], 'a\nb\n', '')
+    """
+    pipeline = Pipeline(
+        commands, env=env, working_dir=working_dir, stdin=stdin, input=input
+    )
+    pipeline.start()
+    pipeline.wait()
+    return pipeline.exit_codes, pipeline.read(), pipeline.eread()
+
+
+def execute_many(
+    commands: Iterable[Union[str, List[str]]],
+    max_parallel: Optional[int] = None,
+    env: Optional[Dict[str, str]] = None,
+    working_dir: Optional[str] = None,
+) -> Generator[Tuple[int, int, str, str], None, None]:
+    """Execute many commands with bounded concurrency.
+
+    At most `max_parallel` children are running at any time. Commands are
+    taken lazily from the iterable, so it can be a generator producing a
+    large number of commands.
+
+    A command that can't be started doesn't affect the rest of the batch.
+    Like in a shell, it's reported with the exit code 127 if its executable
+    wasn't found, 126 if it failed for another reason, and the error message
+    in place of its standard error.
+
+    Closing the generator (or breaking out of the loop that consumes it)
+    cancels the whole batch: commands that didn't start yet are skipped and
+    the running ones are killed.
+
+    Args:
+        commands: Commands to execute.
+        max_parallel: Maximum number of concurrently running children.
+            Defaults to the number of CPUs.
+        env: Environment variables.
+        working_dir: Set the working dir.
+
+    Yields:
+        Tuple[int, int, str, str]: (index, exit_code, stdout, stderr) in the
+            order in which the children finish. `index` is the position of
+            the command in `commands`.
+
+    Example::
+
+        >>> commands = [['echo', str(i)] for i in range(100)]
+        >>> for index, status, out, err in execute_many(commands, 8):
+        ...     print(index, status, out.strip())
+    """
+    max_parallel = max_parallel or os.cpu_count() or 1
+    commands = enumerate(commands)
+    running = set()
+    lock = threading.Lock()
+    cancelled = threading.Event()
+
+    def run(command):
+        if cancelled.is_set():
+            return None
+        try:
+            process = Process(
+                command=command, env=env, working_dir=working_dir
+            )
+            process.start()
+        except ExecutableNotFound as e:
+            return 127, "", e.message
+        except ProcessError as e:
+            return 126, "", e.message
+        with lock:
+            running.add(process)
+        if cancelled.is_set():
+            process.kill()
+        process.wait()
+        with lock:
+            running.discard(process)
+        if cancelled.is_set():
+            return None
+        return process.exit_code, process.read(), process.eread()
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        pending = {
+            executor.submit(run, command): index
+            for index, command in itertools.islice(commands, max_parallel)
+        }
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    for next_index, command in itertools.islice(commands, 1):
+                        pending[executor.submit(run, command)] = next_index
+                    yield (index,) + future.result()
+        finally:
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+            with lock:
+                for process in running:
+                    process.kill()
+
+
 def execute_and_report(command, *args, **kwargs):
     """Execute a command with arguments and wait for output.
 
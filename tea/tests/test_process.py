@@ -1,15 +1,31 @@
+import gc
 import os
 import re
 import sys
 import time
+import subprocess
+import logging
+import threading
 import pytest
+import psutil
+from concurrent.futures import as_completed
 from tea.process import (
     Process,
     ExecutableNotFound,
     execute,
     execute_no_demux,
+    execute_many,
     execute_and_report as er,
+    ProcessTimeout,
+    ProcessInfo,
+    ResultCache,
+    find,
+    get_processes,
 )
+from tea.process.process import ProcessError, _create_env
+from tea.process.hub import Hub
+from tea.process.reaper import Reaper
+from tea.process.watchdog import Watchdog
 
 
 WRITER = """
@@ -73,6 +89,58 @@ def test_write():
     assert re.match(r"^$", p.eread())
 
 
+def test_write_bytes():
+    p = Process(["cat"])
+    p.start()
+    p.write_bytes(b"no newline", flush=False)
+    p.write_bytes(b" \xff")
+    p.close_stdin()
+    p.wait()
+    assert p.read_bytes() == b"no newline \xff"
+
+
+def test_writelines():
+    p = Process(["wc", "-l"])
+    p.start()
+    lines = (f"line {i}" for i in range(100000))
+    assert p.writelines(lines, chunk_size=1000) == sum(
+        len(f"line {i}\n") for i in range(100000)
+    )
+    p.close_stdin()
+    p.wait()
+    assert p.read().strip() == "100000"
+
+
+@pytest.mark.parametrize("source", ["file", "buffered", "iterable"])
+def test_feed_from(tmpdir, source):
+    data = os.urandom(1024 * 1024)
+    path = tmpdir.join("data")
+    path.write_binary(data)
+    p = Process(["cat"], capture="pipe")
+    p.start()
+    if source == "iterable":
+        chunks = [data[i : i + 100] for i in range(0, len(data), 100)]
+        assert p.feed_from(chunks) == len(data)
+    else:
+        buffering = 0 if source == "file" else -1
+        with open(str(path), "rb", buffering=buffering) as f:
+            f.read(10)
+            assert p.feed_from(f) == len(data) - 10
+            assert f.read() == b""
+        data = data[10:]
+    p.close_stdin()
+    p.wait()
+    assert p.read_bytes() == data
+
+
+def test_feed_from_closed_stdin():
+    p = Process(["true"])
+    p.start()
+    p.wait()
+    with pytest.raises(BrokenPipeError):
+        p.feed_from([b"x" * 1024 * 1024])
+
+
 def test_read():
     p = Process([sys.executable, "-c", WRITER.format(out="stdout")])
     p.start()
@@ -154,6 +222,20 @@ def test_override_environment():
     assert re.match(r"^$", error)
 
 
+def test_create_env(monkeypatch):
+    assert _create_env(None) is None
+    monkeypatch.setenv("TEA_CACHED", "first")
+    env = _create_env({"TEA_OVERRIDE": 1})
+    assert env["TEA_CACHED"] == "first"
+    assert env["TEA_OVERRIDE"] == "1"
+    monkeypatch.setenv("TEA_CACHED", "second")
+    env = _create_env({})
+    assert env["TEA_CACHED"] == "second"
+    assert "TEA_OVERRIDE" not in env
+    monkeypatch.delenv("TEA_CACHED")
+    assert "TEA_CACHED" not in _create_env({})
+
+
 def test_working_dir():
     working_dir = sys.exec_prefix.strip(os.pathsep)
     p = Process(
@@ -203,3 +285,876 @@ def test_execute_and_report():
 
 def test_not_existing_command():
     pytest.raises(ExecutableNotFound, lambda: execute("non_existing_command"))
+
+
+def test_wait_timeout(process):
+    process.start()
+    start = time.time()
+    assert not process.wait(0.2)
+    assert time.time() - start < 0.5
+    assert process.is_running
+    assert process.wait()
+    assert not process.is_running
+
+
+def test_wait_wakes_up_on_exit():
+    p = Process(["true"])
+    p.start()
+    start = time.time()
+    assert p.wait(5)
+    assert time.time() - start < 0.1
+    assert p.exit_code == 0
+
+
+def test_pipe_capture():
+    p = Process([sys.executable, "-c", WRITE_BOTH], capture="pipe")
+    p.start()
+    p.wait()
+    assert p.exit_code == 0
+    assert p.read() == "foo"
+    assert p.eread() == "bar"
+    assert p.read() == ""
+
+
+def test_pipe_capture_no_demux():
+    p = Process(
+        [sys.executable, "-c", WRITE_BOTH], capture="pipe", demux=False
+    )
+    p.start()
+    p.wait()
+    assert p.read() == "foobar"
+    assert p.eread() == ""
+
+
+def test_pipe_capture_iter_chunks():
+    p = Process(
+        [sys.executable, "-c", WRITER.format(out="stdout")], capture="pipe"
+    )
+    p.start()
+    chunks = p.iter_chunks()
+    assert next(chunks) == b"foo"
+    assert p.is_running
+    assert list(chunks) == [b"bar"]
+    p.wait()
+    assert p.read() == ""
+
+
+def test_pipe_capture_iter_lines():
+    code = "import sys; print('a'); print('b'); sys.stdout.write('c')"
+    p = Process([sys.executable, "-c", code], capture="pipe")
+    p.start()
+    assert list(p.iter_lines()) == ["a\n", "b\n", "c"]
+    assert list(p.iter_lines(stderr=True)) == []
+
+
+OUTPUT_LINES = """
+import sys
+import time
+
+print("one")
+sys.stdout.flush()
+sys.stderr.write("warning\\n")
+sys.stderr.flush()
+time.sleep(0.2)
+sys.stdout.write("two\\nthree")
+"""
+
+# Like OUTPUT_LINES, but the rest is written after a line is read from stdin.
+OUTPUT_LINES_ON_INPUT = OUTPUT_LINES.replace(
+    "time.sleep(0.2)", "sys.stdin.readline()"
+)
+
+
+def _eventually(poll, timeout=5):
+    # Returns the first truthy result of `poll`, or the last one after the
+    # timeout.
+    deadline = time.time() + timeout
+    while True:
+        result = poll()
+        if result or time.time() > deadline:
+            return result
+        time.sleep(0.01)
+
+
+def test_output_view(tmpdir):
+    size = 10 * 1024 * 1024
+    code = (
+        "import sys; sys.stdout.write('x' * {} + 'needle');"
+        "sys.stderr.write('err')"
+    ).format(size)
+    p = Process([sys.executable, "-c", code])
+    p.start()
+    p.wait()
+    p.read_bytes(10)
+    view = p.stdout_view()
+    # The view covers the whole output, independent of the read position
+    assert len(view) == size + 6
+    assert view.find(b"needle") == size
+    assert view[:3] == b"xxx"
+    assert re.search(rb"x(n\w+)$", view).group(1) == b"needle"
+    with pytest.raises(TypeError):
+        view[0] = 0
+    assert p.stderr_view()[:] == b"err"
+    view.close()
+
+
+def test_output_view_file(tmpdir):
+    path = tmpdir.join("out.txt")
+    p = Process(["echo", "hello"], stdout=str(path))
+    p.start()
+    p.wait()
+    assert p.stdout_view()[:] == b"hello\n"
+    assert p.stderr_view() == b""
+
+
+def test_output_view_pipe_capture():
+    p = Process(["echo", "hello"], capture="pipe")
+    p.start()
+    p.wait()
+    with pytest.raises(ProcessError):
+        p.stdout_view()
+
+
+def test_output_callbacks():
+    stdout, stderr = [], []
+    p = Process(
+        [sys.executable, "-c", OUTPUT_LINES_ON_INPUT],
+        capture="pipe",
+        on_stdout=stdout.append,
+        on_stderr=stderr.append,
+    )
+    p.start()
+    # Callbacks fire as the output arrives, not after the process exits
+    assert _eventually(lambda: stdout and stderr)
+    assert stdout == ["one\n"]
+    p.write("go")
+    p.wait()
+    assert stdout == ["one\n", "two\n", "three"]
+    assert stderr == ["warning\n"]
+    # The output is still captured
+    assert p.read() == "one\ntwo\nthree"
+    assert p.eread() == "warning\n"
+
+
+def test_output_callbacks_chunks():
+    chunks = []
+    p = Process(
+        [sys.executable, "-c", OUTPUT_LINES],
+        capture="pipe",
+        on_stdout=chunks.append,
+        callback_mode="chunk",
+    )
+    p.start()
+    p.wait()
+    assert len(chunks) >= 2
+    assert "".join(chunks) == "one\ntwo\nthree"
+
+
+def test_output_callback_error():
+    def callback(line):
+        raise ValueError(line)
+
+    p = Process(
+        [sys.executable, "-c", OUTPUT_LINES],
+        capture="pipe",
+        on_stdout=callback,
+    )
+    p.start()
+    p.wait()
+    assert p.read() == "one\ntwo\nthree"
+
+
+def test_kill_from_own_callback():
+    code = "import time; print('hi', flush=True); time.sleep(5)"
+    p = Process(
+        [sys.executable, "-c", code],
+        capture="pipe",
+        on_stdout=lambda line: p.kill(),
+    )
+    start = time.time()
+    p.start()
+    assert p.wait(3)
+    other = Process(["echo", "done"], capture="pipe")
+    other.start()
+    assert other.wait(3)
+    assert other.read() == "done\n"
+    assert time.time() - start < 3
+
+
+def test_kill_resolves_future():
+    p = Process(["sh", "-c", "sleep 3 & sleep 3"], capture="pipe")
+    future = p.start(future=True)
+    start = time.time()
+    assert p.kill()
+    assert future.result(timeout=2) == -9
+    assert time.time() - start < 2
+    assert p.exit_code == -9
+    assert not p.is_running
+    assert p.wait(1)
+    assert p.kill() is None
+
+
+def test_blocking_callback_doesnt_stall_other_processes():
+    release = threading.Event()
+    p = Process(
+        ["echo", "hi"],
+        capture="pipe",
+        on_stdout=lambda line: release.wait(5),
+    )
+    p.start()
+    try:
+        other = Process(["echo", "done"], capture="pipe")
+        future = other.start(future=True)
+        assert future.result(3) == 0
+        assert other.read() == "done\n"
+        # Callbacks run before the process counts as finished
+        assert not p.wait(0.2)
+    finally:
+        release.set()
+    assert p.wait(3)
+
+
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_background_descendant_doesnt_delay_wait(capture):
+    p = Process(["sh", "-c", "sleep 5 & echo hi"], capture=capture)
+    p.start()
+    start = time.time()
+    assert p.wait(2)
+    assert time.time() - start < 1
+    assert p.exit_code == 0
+    assert p.read() == "hi\n"
+
+
+def test_kill_doesnt_wait_for_descendants():
+    p = Process(["sh", "-c", "sleep 5 & sleep 5"], capture="pipe")
+    p.start()
+    time.sleep(0.2)
+    start = time.time()
+    assert p.kill()
+    assert time.time() - start < 1
+
+
+def test_tee_to_logger(caplog):
+    logger = logging.getLogger("tea.tests.tee")
+    with caplog.at_level(logging.INFO, logger="tea.tests.tee"):
+        p = Process(
+            [sys.executable, "-c", OUTPUT_LINES],
+            capture="pipe",
+            tee_to=logger,
+        )
+        p.start()
+        p.wait()
+    records = [(r.levelno, r.getMessage()) for r in caplog.records]
+    assert sorted(records) == [
+        (logging.INFO, "one"),
+        (logging.INFO, "three"),
+        (logging.INFO, "two"),
+        (logging.WARNING, "warning"),
+    ]
+    assert p.read() == "one\ntwo\nthree"
+
+
+@pytest.mark.parametrize("mode", ["path", "binary", "text"])
+def test_tee_to_file(tmpdir, mode):
+    path = tmpdir.join("output.log")
+    if mode == "path":
+        tee = str(path)
+    else:
+        tee = open(str(path), "wb" if mode == "binary" else "w")
+    p = Process(
+        [sys.executable, "-c", OUTPUT_LINES], capture="pipe", tee_to=tee
+    )
+    p.start()
+    p.wait()
+    if mode != "path":
+        tee.close()
+    assert sorted(path.read().splitlines()) == [
+        "one",
+        "three",
+        "two",
+        "warning",
+    ]
+    assert p.read() == "one\ntwo\nthree"
+
+
+def test_output_consumers_require_pipe_capture():
+    with pytest.raises(ProcessError):
+        Process(["true"], on_stdout=print)
+    with pytest.raises(ProcessError):
+        Process(["true"], tee_to=logging.getLogger())
+    with pytest.raises(ProcessError):
+        Process(["true"], capture="pipe", callback_mode="word")
+
+
+def test_pipe_capture_spill():
+    code = "import sys; sys.stdout.write('x' * 100000 + 'end')"
+    p = Process([sys.executable, "-c", code], capture="pipe", capture_spill=10)
+    p.start()
+    p.wait()
+    assert p._stdout_reader.spilled
+    assert p.read() == "x" * 100000 + "end"
+    assert p.stdout_dropped == 0
+
+
+def test_pipe_capture_limit():
+    code = "import sys; sys.stdout.write('a' * 10 + 'x' * 100000 + 'b' * 10)"
+    p = Process([sys.executable, "-c", code], capture="pipe", capture_limit=20)
+    p.start()
+    p.wait()
+    assert p.read() == "a" * 10 + "b" * 10
+    assert p.stdout_dropped == 100000
+    assert p.stderr_dropped == 0
+
+
+def test_pipe_capture_errors(tmpdir):
+    with pytest.raises(ProcessError):
+        Process(["true"], capture="memory")
+    with pytest.raises(ProcessError):
+        Process(["true"], stdout=tmpdir.join("out").strpath, capture="pipe")
+    with pytest.raises(ProcessError):
+        Process(["true"], capture_limit=100)
+    p = Process(["true"])
+    p.start()
+    with pytest.raises(ProcessError):
+        p.iter_chunks()
+
+
+LIMITS = """
+import os
+import resource
+
+print(sorted(os.sched_getaffinity(0)))
+print(os.nice(0))
+print(resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+print(resource.getrlimit(resource.RLIMIT_CPU)[0])
+"""
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="Linux only"
+)
+@pytest.mark.parametrize("spawn", ["auto", "posix_spawn"])
+def test_limits(spawn):
+    cpu = sorted(os.sched_getaffinity(0))[0]
+    p = Process(
+        [sys.executable, "-c", LIMITS],
+        cpu_affinity=[cpu],
+        nice=3,
+        rlimits={"nofile": 64, "cpu": (100, 100)},
+        spawn=spawn,
+    )
+    p.start()
+    p.wait()
+    assert p.read().split("\n")[:4] == [
+        str([cpu]),
+        str(os.nice(0) + 3),
+        "64",
+        "100",
+    ]
+
+
+@pytest.mark.skipif(
+    not hasattr(psutil, "IOPRIO_CLASS_IDLE"), reason="Linux only"
+)
+def test_ionice():
+    p = Process(["sleep", "5"], ionice="idle")
+    p.start()
+    try:
+        assert psutil.Process(p.pid).ionice().ioclass == (
+            psutil.IOPRIO_CLASS_IDLE
+        )
+    finally:
+        p.kill()
+
+
+def test_limits_errors():
+    with pytest.raises(ProcessError):
+        Process(["true"], rlimits={"no-such-limit": 1})
+    with pytest.raises(ProcessError):
+        Process(["true"], ionice="fast")
+    p = Process(["true"])
+    with pytest.raises(ProcessError):
+        p.set_cpu_affinity([0])
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="Linux only"
+)
+def test_set_cpu_affinity():
+    cpu = sorted(os.sched_getaffinity(0))[-1]
+    code = "import threading, time; threading.Thread(target=time.sleep, "
+    code += "args=(5,)).start(); time.sleep(5)"
+    p = Process([sys.executable, "-c", code])
+    p.start()
+    try:
+        time.sleep(0.2)
+        p.set_cpu_affinity([cpu], tree=True)
+        for thread in psutil.Process(p.pid).threads():
+            assert os.sched_getaffinity(thread.id) == {cpu}
+    finally:
+        p.kill()
+
+
+def test_execute_limits():
+    code = "import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE))"
+    status, out, err = execute(
+        [sys.executable, "-c", code], rlimits={"nofile": (32, 32)}
+    )
+    assert out.strip() == "(32, 32)"
+    status, out = execute_no_demux(
+        [sys.executable, "-c", code], rlimits={"nofile": (32, 32)}
+    )
+    assert out.strip() == "(32, 32)"
+
+
+def test_execute_cache(tmpdir):
+    cache = ResultCache(str(tmpdir.join("cache")))
+    source = tmpdir.join("input.txt")
+    source.write("one")
+    command = ["cat", "input.txt"]
+    kwargs = {"working_dir": str(tmpdir), "inputs": ["input.txt"]}
+    assert execute(command, cache=cache, **kwargs) == (0, "one", "")
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert execute(command, cache=cache, **kwargs) == (0, "one", "")
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Changing an input invalidates the result
+    source.write("two")
+    assert execute(command, cache=cache, **kwargs) == (0, "two", "")
+    assert (cache.hits, cache.misses) == (1, 2)
+    # So does a different environment
+    env = {"TEA_CACHE_TEST": "1"}
+    assert execute(command, env=env, cache=cache, **kwargs)[1] == "two"
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.size > 0
+    cache.clear()
+    assert (cache.hits, cache.misses, cache.size) == (0, 0, 0)
+
+
+def test_execute_cache_env_vars(tmpdir, monkeypatch):
+    cache = ResultCache(str(tmpdir))
+    command = [sys.executable, "-c", PRINT_VAR.format(var="TEA_CACHE_VAR")]
+    monkeypatch.setenv("TEA_CACHE_VAR", "a")
+    assert execute(command, cache=cache, cache_env=["TEA_CACHE_VAR"])[1] == (
+        "a\n"
+    )
+    monkeypatch.setenv("TEA_CACHE_VAR", "b")
+    assert execute(command, cache=cache, cache_env=["TEA_CACHE_VAR"])[1] == (
+        "b\n"
+    )
+    # Variables that are not selected are not part of the key
+    assert execute(command, cache=cache)[1] == "b\n"
+    monkeypatch.setenv("TEA_CACHE_VAR", "c")
+    assert execute(command, cache=cache)[1] == "b\n"
+
+
+def test_execute_cache_failures(tmpdir):
+    cache = ResultCache(str(tmpdir))
+    command = [sys.executable, "-c", "import sys; sys.exit(1)"]
+    execute(command, cache=cache)
+    execute(command, cache=cache)
+    assert cache.hits == 0
+    cache = ResultCache(str(tmpdir), cache_failures=True)
+    execute(command, cache=cache)
+    assert execute(command, cache=cache)[0] == 1
+    assert cache.hits == 1
+    with pytest.raises(ProcessError):
+        execute(command, cache=cache, wait=False)
+    with pytest.raises(ProcessError):
+        ResultCache(str(tmpdir), fingerprint="sha1")
+
+
+def test_execute_cache_eviction(tmpdir):
+    cache = ResultCache(str(tmpdir), max_size=250, fingerprint="mtime")
+    for i in range(3):
+        execute(["echo", "x" * 50, str(i)], cache=cache)
+        # Make sure the access times differ
+        time.sleep(0.01)
+    # The least recently used result was evicted
+    assert cache.size <= 250
+    execute(["echo", "x" * 50, "0"], cache=cache)
+    execute(["echo", "x" * 50, "2"], cache=cache)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_execute_cache_ignores_foreign_files(tmpdir):
+    tmpdir.join("package.json").write("{}")
+    tmpdir.join("notes.txt").write("keep")
+    orphan = tmpdir.join("tea-result-orphan.tmp")
+    orphan.write("partial")
+    old = time.time() - 2 * 3600
+    os.utime(str(orphan), (old, old))
+    in_progress = tmpdir.join("tea-result-writing.tmp")
+    in_progress.write("partial")
+    cache = ResultCache(str(tmpdir), max_size=100)
+    assert cache.size == 0
+    assert not orphan.exists()
+    assert in_progress.exists()
+    for i in range(3):
+        execute(["echo", "x" * 50, str(i)], cache=cache)
+    assert 0 < cache.size <= 100
+    cache.clear()
+    assert cache.size == 0
+    assert tmpdir.join("package.json").read() == "{}"
+    assert tmpdir.join("notes.txt").read() == "keep"
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "notes.txt",
+        "package.json",
+        "tea-result-writing.tmp",
+    ]
+
+
+def test_execute_many():
+    commands = [["echo", str(i)] for i in range(10)]
+    results = sorted(execute_many(commands, max_parallel=3))
+    assert results == [(i, 0, f"{i}\n", "") for i in range(10)]
+
+
+def test_execute_many_max_parallel():
+    start = time.time()
+    results = list(execute_many([["sleep", "0.3"]] * 4, max_parallel=2))
+    elapsed = time.time() - start
+    assert len(results) == 4
+    assert 0.6 <= elapsed < 1.2
+
+
+def test_execute_many_start_failure():
+    commands = [["echo", "1"], ["/nonexistent"], ["echo", "2"]]
+    results = sorted(execute_many(commands, max_parallel=3))
+    assert results[0] == (0, 0, "1\n", "")
+    assert results[1][:3] == (1, 127, "")
+    assert "/nonexistent" in results[1][3]
+    assert results[2] == (2, 0, "2\n", "")
+
+
+def test_execute_many_cancel():
+    code = "import sys, time; time.sleep(float(sys.argv[1]))"
+    commands = [[sys.executable, "-c", code, "0"]] + [
+        [sys.executable, "-c", code, "10"]
+    ] * 10
+    start = time.time()
+    batch = execute_many(commands, max_parallel=4)
+    assert next(batch)[:2] == (0, 0)
+    batch.close()
+    assert time.time() - start < 5
+
+
+@pytest.mark.skipif(not Hub.pidfd_supported(), reason="pidfd not supported")
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_thread_count_is_constant(capture):
+    Process(["true"], capture=capture).start()
+    threads = threading.active_count()
+    processes = [
+        Process(["sleep", "0.5"], capture=capture) for _ in range(50)
+    ]
+    for p in processes:
+        p.start()
+    assert threading.active_count() == threads
+    for p in processes:
+        assert p.wait(5)
+        assert p.exit_code == 0
+
+
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_start_future(capture):
+    code = "import sys; print(sys.argv[1]); sys.exit(int(sys.argv[1]))"
+    processes = {}
+    for i in range(20):
+        p = Process([sys.executable, "-c", code, str(i)], capture=capture)
+        processes[p.start(future=True)] = p
+    completed = 0
+    for future in as_completed(processes, timeout=30):
+        p = processes[future]
+        assert future.result() == p.exit_code
+        # The output is captured when the future resolves
+        assert p.read() == f"{future.result()}\n"
+        completed += 1
+    assert completed == 20
+    assert Process(["true"]).start() is None
+
+
+@pytest.mark.parametrize("spawn", ["auto", "posix_spawn", "fork"])
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_spawn_strategies(spawn, capture):
+    p = Process(
+        [sys.executable, "-c", WRITE_BOTH], spawn=spawn, capture=capture
+    )
+    p.start()
+    p.wait()
+    assert p.exit_code == 0
+    assert p.read() == "foo"
+    assert p.eread() == "bar"
+    p = Process(
+        [sys.executable, "-c", WRITE_BOTH],
+        spawn=spawn,
+        capture=capture,
+        demux=False,
+    )
+    p.start()
+    p.wait()
+    assert p.read() == "foobar"
+
+
+@pytest.mark.parametrize("spawn", ["posix_spawn", "fork"])
+def test_spawn_strategies_stdin_and_env(spawn):
+    code = "import os; print(input() + os.environ['TEA_SPAWN'])"
+    p = Process(
+        [sys.executable, "-c", code], env={"TEA_SPAWN": "!"}, spawn=spawn
+    )
+    p.start()
+    p.write("hello")
+    p.wait()
+    assert p.read() == "hello!\n"
+    p = Process(["sh", "-c", "pwd"], working_dir="/", spawn=spawn)
+    p.start()
+    p.wait()
+    assert p.read() == "/\n"
+    with pytest.raises(ExecutableNotFound):
+        Process(["non_existing_command"], spawn=spawn).start()
+    with pytest.raises(ProcessError):
+        Process(["true"], spawn="vfork")
+
+
+LINES = """
+import sys
+import time
+
+sys.stdout.write("first\\nsec")
+sys.stdout.flush()
+sys.stdin.readline()
+sys.stdout.write("ond\\nlast")
+"""
+
+
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_readline(capture):
+    p = Process([sys.executable, "-c", LINES], capture=capture)
+    p.start()
+    assert _eventually(p.readline) == b"first\n"
+    assert p.readline() == b""
+    p.write("go")
+    p.wait()
+    assert p.readline() == b"second\n"
+    assert p.readline() == b"last"
+    assert p.readline() == b""
+
+
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_read_bytes_and_read_since(capture):
+    p = Process([sys.executable, "-c", WRITE_BOTH], capture=capture)
+    p.start()
+    p.wait()
+    assert p.read_bytes(2) == b"fo"
+    assert p.read_since(1) == b"oo"
+    assert p.read_since(3) == b""
+    assert p.read_bytes() == b"o"
+    assert p.read_bytes(stderr=True) == b"bar"
+    assert p.read_since(0, stderr=True) == b"bar"
+
+
+@pytest.mark.parametrize("capture", ["file", "pipe"])
+def test_incremental_decoding(capture):
+    code = (
+        "import sys; out = sys.stdout.buffer; err = sys.stderr.buffer;"
+        "out.write(b'a\\xc5'); out.flush(); err.write(b'\\xe9'); err.flush();"
+        "sys.stdin.readline(); out.write(b'\\xa1')"
+    )
+    p = Process([sys.executable, "-c", code], capture=capture)
+    p.start()
+    # The first byte of the character is kept by the decoder.
+    assert _eventually(p.read) == "a"
+    p.write("go")
+    p.wait()
+    assert p.read() == "\u0161"
+    p = Process([sys.executable, "-c", code], encoding="latin-1")
+    p.start()
+    p.write("go")
+    p.wait()
+    assert p.eread() == "\xe9"
+
+
+def test_rusage():
+    code = "x = bytearray(50 * 1024 * 1024); sum(range(3000000))"
+    p = Process([sys.executable, "-c", code])
+    assert p.rusage is None
+    p.start()
+    assert p.rusage is None
+    p.wait()
+    usage = p.rusage
+    assert usage.user_time + usage.system_time > 0
+    assert usage.max_rss > 50 * 1024 * 1024
+    assert usage.voluntary_switches >= 0
+    assert usage.involuntary_switches >= 0
+    assert 0 < usage.wall_time < 10
+
+
+def test_execute_with_stats():
+    status, output, error, usage = execute(["echo", "foo"], with_stats=True)
+    assert (status, output, error) == (0, "foo\n", "")
+    assert usage.start_time <= usage.end_time
+
+
+def _is_dead(pid):
+    try:
+        return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
+
+
+def test_timeout_kills_process_tree():
+    p = Process(
+        ["sh", "-c", "sleep 30 & echo $!; sleep 30"],
+        timeout=0.3,
+        kill_grace=1,
+    )
+    start = time.time()
+    p.start()
+    assert p.wait(5)
+    assert time.time() - start < 2
+    assert p.timed_out
+    assert p.exit_code == -15
+    grandchild = int(p.read())
+    deadline = time.time() + 2
+    while not _is_dead(grandchild) and time.time() < deadline:
+        time.sleep(0.05)
+    assert _is_dead(grandchild)
+
+
+STUBBORN_GRANDCHILD = """
+import subprocess
+import sys
+import time
+
+code = (
+    "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+    "print('ready', flush=True); time.sleep(30)"
+)
+grandchild = subprocess.Popen([sys.executable, "-c", code],
+                              stdout=subprocess.PIPE)
+grandchild.stdout.readline()
+print(grandchild.pid, flush=True)
+time.sleep(30)
+"""
+
+
+def test_timeout_kills_grandchild_ignoring_sigterm():
+    with pytest.raises(ProcessTimeout) as error:
+        execute(
+            [sys.executable, "-c", STUBBORN_GRANDCHILD],
+            timeout=1,
+            kill_grace=0.5,
+        )
+    assert error.value.exit_code == -15
+    grandchild = int(error.value.stdout)
+    deadline = time.time() + 3
+    while not _is_dead(grandchild) and time.time() < deadline:
+        time.sleep(0.05)
+    assert _is_dead(grandchild)
+
+
+def test_timeout_escalates_to_sigkill():
+    code = "import signal, time; signal.signal(signal.SIGTERM, print); "
+    code += "print('ready', flush=True); time.sleep(30)"
+    start = time.time()
+    with pytest.raises(ProcessTimeout) as error:
+        execute([sys.executable, "-c", code], timeout=0.5, kill_grace=0.5)
+    assert 1 <= time.time() - start < 3
+    assert error.value.exit_code == -9
+    assert error.value.stdout.startswith("ready")
+    with pytest.raises(ProcessTimeout):
+        execute_no_demux(["sleep", "30"], timeout=0.1)
+
+
+def test_no_timeout():
+    p = Process(["true"], timeout=5)
+    p.start()
+    p.wait()
+    assert not p.timed_out
+    assert p.exit_code == 0
+    assert execute(["echo", "foo"], timeout=5) == (0, "foo\n", "")
+
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(
+    not os.path.isdir("/proc/self/fd"), reason="Requires /proc"
+)
+def test_finished_timeouts_are_released():
+    execute(["true"], timeout=3600)
+    gc.collect()
+    fds = _open_fds()
+    for _ in range(100):
+        execute(["true"], timeout=3600)
+    gc.collect()
+    assert _open_fds() - fds < 10
+    assert Watchdog().size < 10
+
+
+def test_cancelled_timer_drops_callback():
+    watchdog = Watchdog()
+    timers = [watchdog.schedule(3600, lambda: None) for _ in range(10)]
+    for timer in timers:
+        timer.cancel()
+        assert timer.callback is None
+    assert watchdog.size < 10
+
+
+def test_get_processes():
+    processes = get_processes()
+    assert all(isinstance(p, ProcessInfo) for p in processes)
+    assert processes == sorted(processes, key=lambda p: (p.command, p.pid))
+    assert os.getpid() in {p.pid for p in processes}
+    processes = get_processes(sort_by_name=False)
+    assert [p.pid for p in processes] == sorted(p.pid for p in processes)
+    processes = get_processes(predicate=lambda pid, _: pid == os.getpid())
+    assert [p.pid for p in processes] == [os.getpid()]
+
+
+def test_find():
+    p = Process(["sleep", "7.25"])
+    p.start()
+    try:
+        found = find("SLEEP", "7.25")
+        assert found.pid == p.pid
+        assert found.command == "sleep"
+        assert found.arguments == ["7.25"]
+        assert find("sleep", "no-such-argument") is None
+        assert find("no-such-process") is None
+    finally:
+        p.kill()
+
+
+def test_reaper_without_pidfd(monkeypatch):
+    monkeypatch.setattr(Hub, "pidfd_supported", staticmethod(lambda: False))
+    # Exits first and must be left for its owner to reap.
+    foreign = subprocess.Popen(["sh", "-c", "exit 3"])
+    # Starts the shared threads.
+    warm_up = Process(["true"], capture="pipe")
+    warm_up.start()
+    assert warm_up.wait(5)
+    threads = threading.active_count()
+    processes = [
+        Process(["sh", "-c", f"sleep 0.2; exit {i}"], capture="pipe")
+        for i in range(20)
+    ]
+    for p in processes:
+        p.start()
+    assert threading.active_count() == threads
+    for i, p in enumerate(processes):
+        assert p.wait(5)
+        assert p.exit_code == i
+        assert p.rusage is not None
+    assert foreign.wait(1) == 3
+    assert Reaper().size == 0
+
+
+def test_drain_after_one_pipe_closed(caplog):
+    # stdout reaches EOF before the exit, stderr is held by a descendant.
+    code = "exec >&-; echo err >&2; sleep 5 & exit 0"
+    with caplog.at_level(logging.ERROR, logger="tea.process.hub"):
+        p = Process(["sh", "-c", code], capture="pipe")
+        p.start()
+        assert p.wait(2)
+    assert p.eread() == "err\n"
+    assert not caplog.records
@@ -0,0 +1,136 @@
+import sys
+import time
+import asyncio
+
+import pytest
+
+from tea.process import AsyncProcess, ExecutableNotFound
+from tea.process import aio
+
+
+WRITE_BOTH = """
+import sys
+
+sys.stdout.write("foo")
+sys.stdout.flush()
+sys.stderr.write("bar")
+sys.stderr.flush()
+"""
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_start_and_wait():
+    async def main():
+        p = AsyncProcess(["sleep", "0.2"])
+        await p.start()
+        assert p.is_running
+        assert p.exit_code is None
+        assert await p.wait()
+        assert not p.is_running
+        assert p.exit_code == 0
+
+    run(main())
+
+
+def test_wait_timeout():
+    async def main():
+        p = AsyncProcess(["sleep", "1"])
+        await p.start()
+        start = time.time()
+        assert not await p.wait(0.1)
+        assert time.time() - start < 0.5
+        assert await p.kill()
+        assert not p.is_running
+
+    run(main())
+
+
+def test_write_and_read():
+    async def main():
+        p = AsyncProcess([sys.executable, "-c", "print('Said: ' + input())"])
+        await p.start()
+        await p.write("hello")
+        await p.wait()
+        assert await p.read() == "Said: hello\n"
+        assert await p.eread() == ""
+
+    run(main())
+
+
+def test_iter_lines():
+    async def main():
+        code = "import sys; print('a'); print('b'); sys.stdout.write('c')"
+        p = AsyncProcess([sys.executable, "-c", code])
+        await p.start()
+        lines = [line async for line in p]
+        assert lines == ["a\n", "b\n", "c"]
+        assert await p.wait()
+        assert await p.read() == ""
+
+    run(main())
+
+
+def test_background_descendant_doesnt_delay_wait():
+    async def main():
+        p = AsyncProcess(["sh", "-c", "sleep 3 & echo hi"])
+        start = time.time()
+        await p.start()
+        assert await p.wait(2)
+        assert time.time() - start < 2
+        assert p.exit_code == 0
+        assert await p.read() == "hi\n"
+
+    run(main())
+
+
+def test_incremental_decoding():
+    async def main():
+        code = (
+            "import sys; out = sys.stdout.buffer; "
+            "out.write(b'a\\xc5'); out.flush(); input(); "
+            "out.write(b'\\xbe'); out.flush()"
+        )
+        p = AsyncProcess([sys.executable, "-c", code])
+        await p.start()
+        output = ""
+        deadline = time.time() + 5
+        while not output and time.time() < deadline:
+            await asyncio.sleep(0.01)
+            # The first byte of the character is kept by the decoder.
+            output = await p.read()
+        assert output == "a"
+        await p.write("go")
+        assert await p.wait(5)
+        assert await p.read() == "\u017e"
+
+    run(main())
+
+
+def test_execute():
+    assert run(aio.execute([sys.executable, "-c", WRITE_BOTH])) == (
+        0,
+        "foo",
+        "bar",
+    )
+    assert run(aio.execute_no_demux([sys.executable, "-c", WRITE_BOTH])) == (
+        0,
+        "foobar",
+    )
+
+
+def test_execute_concurrently():
+    async def main():
+        return await asyncio.gather(
+            *[aio.execute(["echo", str(i)]) for i in range(20)]
+        )
+
+    results = run(main())
+    assert [out for _, out, _ in results] == [f"{i}\n" for i in range(20)]
+
+
+def test_not_existing_command():
+    with pytest.raises(ExecutableNotFound):
+        run(aio.execute("non_existing_command"))
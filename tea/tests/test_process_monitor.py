@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import psutil
+import pytest
+from tea.process import Monitor, Process
+from tea.process.process import ProcessError
+
+
+ALLOCATE = """
+import time
+
+data = bytearray(32 * 1024 * 1024)
+time.sleep(0.5)
+"""
+
+
+def test_monitor():
+    with Monitor(interval=0.05, history=4) as monitor:
+        p = Process([sys.executable, "-c", ALLOCATE])
+        p.start()
+        monitor.register(p)
+        assert monitor.processes == [p]
+        p.wait()
+    samples = monitor.samples(p)
+    # Only the last samples are kept
+    assert 0 < len(samples) <= 4
+    assert samples == sorted(samples, key=lambda s: s.time)
+    summary = monitor.summary(p)
+    assert summary.samples == len(samples)
+    assert summary.peak_rss >= 32 * 1024 * 1024
+    assert summary.peak_rss >= summary.mean_rss > 0
+    assert summary.peak_cpu_percent >= summary.mean_cpu_percent >= 0
+    monitor.unregister(p)
+    assert monitor.processes == []
+    assert monitor.samples(p) == []
+    assert monitor.summary(p).samples == 0
+
+
+def test_register_not_running():
+    p = Process(["true"])
+    monitor = Monitor()
+    with pytest.raises(ProcessError):
+        monitor.register(p)
+    p.start()
+    p.wait()
+    with pytest.raises(ProcessError):
+        monitor.register(p)
+
+
+def test_finished_process_is_not_sampled():
+    with Monitor(interval=0.02) as monitor:
+        p = Process(["sleep", "5"])
+        p.start()
+        monitor.register(p)
+        # Simulate the PID being reused by a live process once p is gone
+        monitor._series[p].handle = psutil.Process(os.getpid())
+        time.sleep(0.1)
+        assert monitor.samples(p)
+        p.kill()
+        time.sleep(0.05)
+        count = len(monitor.samples(p))
+        time.sleep(0.2)
+        assert len(monitor.samples(p)) == count
@@ -0,0 +1,72 @@
+import sys
+
+import pytest
+from tea.process import Pipeline, execute_pipeline, ExecutableNotFound
+from tea.process.process import ProcessError
+
+
+def test_pipeline():
+    pipeline = Pipeline([["printf", "b\\na\\nb\\n"], ["sort"], ["uniq", "-c"]])
+    pipeline.start()
+    assert pipeline.wait(5)
+    assert pipeline.exit_codes == [0, 0, 0]
+    assert pipeline.exit_code == 0
+    assert pipeline.read().split() == ["1", "a", "2", "b"]
+    assert not pipeline.is_running
+
+
+def test_exit_codes_and_stderr():
+    code = "import sys; sys.stderr.write('first'); sys.exit(3)"
+    pipeline = Pipeline([[sys.executable, "-c", code], ["cat"]])
+    pipeline.start()
+    pipeline.wait()
+    assert pipeline.exit_codes == [3, 0]
+    assert pipeline.eread(0) == "first"
+    assert pipeline.eread() == ""
+
+
+def test_stdin_file(tmpdir):
+    path = tmpdir.join("input.txt")
+    path.write("one\ntwo\nthree\n")
+    result = execute_pipeline([["grep", "t"], ["wc", "-l"]], stdin=str(path))
+    assert result[1].strip() == "2"
+    with open(str(path), "rb", buffering=0) as f:
+        f.read(4)
+        # The child continues from the current offset of the file.
+        assert execute_pipeline([["cat"]], stdin=f)[1] == "two\nthree\n"
+
+
+def test_input():
+    data = b"x" * (1024 * 1024)
+    exit_codes, out, err = execute_pipeline(
+        [["cat"], ["wc", "-c"]], input=data
+    )
+    assert exit_codes == [0, 0]
+    assert out.strip() == str(len(data))
+    # The first stage exits without reading its input.
+    assert execute_pipeline([["true"]], input=data) == ([0], "", "")
+
+
+def test_early_exit():
+    # `yes` is killed by SIGPIPE once `head` has exited.
+    exit_codes, out, err = execute_pipeline([["yes"], ["head", "-n", "2"]])
+    assert out == "y\ny\n"
+    assert exit_codes[1] == 0
+
+
+def test_errors():
+    with pytest.raises(ProcessError):
+        Pipeline([])
+    with pytest.raises(ProcessError):
+        Pipeline([["cat"]], stdin="/dev/null", input=b"")
+    pipeline = Pipeline([["sleep", "10"], ["no-such-executable"]])
+    with pytest.raises(ExecutableNotFound):
+        pipeline.start()
+    assert not pipeline.is_running
+
+
+def test_kill():
+    pipeline = Pipeline([["sleep", "10"], ["cat"]])
+    pipeline.start()
+    pipeline.kill()
+    assert pipeline.exit_codes == [-9, -9]
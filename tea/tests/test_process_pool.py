@@ -0,0 +1,88 @@
+import sys
+
+import pytest
+from tea.process import WorkerPool
+from tea.process.process import ProcessError
+
+
+def greet(name, punctuation="!"):
+    print(f"Hello {name}{punctuation}")
+    sys.stderr.write("done")
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with WorkerPool(processes=2, preload=["json"]) as pool:
+        yield pool
+
+
+def test_execute_code(pool):
+    code = "import sys; print(sys.argv[1:]); sys.stderr.write('err')"
+    assert pool.execute_code(code, ["a", "b"]) == (0, "['a', 'b']\n", "err")
+
+
+def test_exit_code(pool):
+    assert pool.execute_code("import sys; sys.exit(3)") == (3, "", "")
+    status, out, err = pool.execute_code("import sys; sys.exit('failed')")
+    assert (status, err) == (1, "failed\n")
+    status, out, err = pool.execute_code("raise ValueError('boom')")
+    assert status == 1
+    assert "ValueError: boom" in err
+
+
+def test_execute(pool, tmpdir):
+    script = tmpdir.join("script.py")
+    script.write(
+        "import sys\n"
+        "if __name__ == '__main__':\n"
+        "    print(sys.argv)\n"
+    )
+    status, out, err = pool.execute(str(script), ["x"])
+    assert (status, out, err) == (0, f"{[str(script), 'x']}\n", "")
+
+
+def test_call(pool):
+    assert pool.call(greet, "tea", punctuation="?") == (
+        0,
+        "Hello tea?\n",
+        "done",
+    )
+
+
+def test_subprocess_output(pool):
+    code = "import os; os.system('echo from-shell')"
+    assert pool.execute_code(code) == (0, "from-shell\n", "")
+
+
+def test_preload(pool):
+    code = "import sys; print('json' in sys.modules)"
+    assert pool.execute_code(code)[1] == "True\n"
+
+
+def test_recycle():
+    code = "import os; print(os.getpid())"
+    with WorkerPool(processes=1, max_tasks=1) as pool:
+        pids = {pool.execute_code(code)[1] for _ in range(3)}
+    assert len(pids) == 3
+
+
+def test_execute_imports_sibling_module(pool, tmpdir):
+    tmpdir.join("sibling_for_pool.py").write("ANSWER = 42\n")
+    script = tmpdir.join("main.py")
+    script.write("import sibling_for_pool\nprint(sibling_for_pool.ANSWER)\n")
+    path = sys.path[:]
+    assert pool.execute(str(script)) == (0, "42\n", "")
+    assert pool.execute_code("import sys; print(sys.path[0])")[1] != str(
+        tmpdir
+    )
+    assert sys.path == path
+
+
+def test_worker_death():
+    with WorkerPool(processes=1) as pool:
+        with pytest.raises(ProcessError):
+            pool.execute_code("import os; os._exit(3)")
+        with pytest.raises(ProcessError):
+            pool.execute_code("import os, signal; os.kill(os.getpid(), 9)")
+        # The worker is replaced and the pool keeps working
+        assert pool.execute_code("print('ok')") == (0, "ok\n", "")
@@ -0,0 +1,99 @@
+import os
+from unittest import mock
+
+import psutil
+import pytest
+from tea.process import Process, ProcessTable, find
+
+
+def test_find():
+    p = Process(["sleep", "7.5"])
+    p.start()
+    pid = p.pid
+    try:
+        table = ProcessTable()
+        found = table.find("SLEEP", "7.5")
+        assert found.pid == pid
+        assert found.arguments == ["7.5"]
+        assert find("sleep", "7.5", table=table).pid == p.pid
+        assert table.find("sleep", "no-such-argument") is None
+        assert table.find("no-such-process") is None
+        assert p.pid in {i.pid for i in table.find_all("sleep")}
+        assert [i.pid for i in table.find_by_regex("^sle+p$", r"^7\.5$")] == [
+            p.pid
+        ]
+    finally:
+        p.kill()
+    p.wait()
+    # The table is a snapshot until it's refreshed.
+    assert table.find("sleep", "7.5").pid == pid
+    table.refresh()
+    assert table.find("sleep", "7.5") is None
+
+
+def test_incremental_refresh():
+    table = ProcessTable()
+    table.refresh()
+    assert len(table) > 0
+    with mock.patch.object(
+        psutil.Process, "cmdline", autospec=True
+    ) as cmdline:
+        table.refresh()
+        assert cmdline.call_count <= 1
+    p = Process(["sleep", "7.75"])
+    p.start()
+    try:
+        table.refresh()
+        assert table.find("sleep", "7.75").pid == p.pid
+    finally:
+        p.kill()
+
+
+def test_max_age():
+    table = ProcessTable(max_age=0)
+    assert table.find("no-such-process") is None
+    assert os.getpid() in {p.pid for p in table.find_by_regex(".")}
+    p = Process(["sleep", "7.85"])
+    p.start()
+    try:
+        assert table.find("sleep", "7.85").pid == p.pid
+    finally:
+        p.kill()
+
+
+def test_exact_find():
+    p = Process(["sleep", "7.95"])
+    p.start()
+    try:
+        table = ProcessTable()
+        assert table.find("SLEEP", "7.95", exact=True).pid == p.pid
+        assert table.find("sleep", "7.9", exact=True) is None
+        assert table.find("slee", exact=True) is None
+        assert p.pid in {i.pid for i in table.find_all("sleep", exact=True)}
+    finally:
+        p.kill()
+
+
+def test_reused_pid_is_read_again():
+    p = Process(["sleep", "7.65"])
+    p.start()
+    try:
+        table = ProcessTable()
+        # Pretend the table was built when the PIDs belonged to other
+        # processes.
+        with mock.patch(
+            "tea.process.table._create_time", return_value=1.0
+        ), mock.patch.object(
+            psutil.Process, "cmdline", return_value=["dead-service"]
+        ):
+            table.refresh()
+        assert table.find("dead-service", exact=True) is not None
+        table.refresh()
+        assert table.find("dead-service") is None
+        found = table.find("sleep", "7.65", exact=True)
+        assert found.pid == p.pid
+        assert found.create_time == pytest.approx(
+            psutil.Process(p.pid).create_time(), abs=1
+        )
+    finally:
+        p.kill()
@@ -1,3 +1,8 @@
+import os
+import datetime
+import re
+import time
+import tempfile
 import unittest
 from unittest import mock
 
@@ -74,3 +79,154 @@ class TestGoto(unittest.TestCase):
                 os.chdir.assert_called_with("some_directory")
                 raise Exception("Failed")
         os.chdir.assert_called_with("foo")
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        for path in [
+            "a.py",
+            "b.txt",
+            "src/c.py",
+            "src/pkg/d.py",
+            ".git/objects/e.py",
+            "build/f.py",
+        ]:
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def search(self, *args, **kwargs):
+        found = shell.search(self.root, *args, **kwargs)
+        return sorted(os.path.relpath(path, self.root) for path in found)
+
+    def test_pattern(self):
+        self.assertEqual(
+            self.search("*.py"),
+            [".git/objects/e.py", "a.py", "build/f.py", "src/c.py",
+             "src/pkg/d.py"],
+        )
+
+    def test_dirs(self):
+        self.assertEqual(
+            self.search(dirs=True, files=False),
+            [".git", ".git/objects", "build", "src", "src/pkg"],
+        )
+
+    def test_compiled_regex_and_callable(self):
+        self.assertEqual(self.search(re.compile(r"[ab]\.")), ["a.py", "b.txt"])
+        self.assertEqual(
+            self.search(lambda name: name.startswith("d")), ["src/pkg/d.py"]
+        )
+
+    def test_max_depth(self):
+        self.assertEqual(self.search("*.py", max_depth=1), ["a.py"])
+        self.assertEqual(
+            self.search("*.py", max_depth=2),
+            ["a.py", "build/f.py", "src/c.py"],
+        )
+
+    def test_exclude(self):
+        self.assertEqual(
+            self.search(dirs=True, exclude=[".git", "bui*"]),
+            ["a.py", "b.txt", "src", "src/c.py", "src/pkg", "src/pkg/d.py"],
+        )
+
+    def test_symlinked_directory_is_not_followed(self):
+        os.symlink(
+            os.path.join(self.root, "src"), os.path.join(self.root, "link")
+        )
+        self.assertEqual(self.search("link", dirs=True), ["link"])
+        self.assertEqual(self.search("c.py"), ["src/c.py"])
+
+    def test_serial(self):
+        self.assertEqual(
+            self.search(dirs=True, exclude=".git", max_depth=2, workers=1),
+            self.search(dirs=True, exclude=".git", max_depth=2),
+        )
+
+    def test_is_generator(self):
+        found = shell.search(self.root, workers=1)
+        self.assertTrue(next(found).startswith(self.root))
+        found.close()
+
+
+class TestSearchEntries(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        self.now = time.time()
+        for path, size, age in [
+            ("small.log", 10, 0),
+            ("big.log", 1000, 0),
+            ("old/big.log", 2000, 3600),
+            ("old/notes.txt", 500, 3600),
+        ]:
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"x" * size)
+            os.utime(path, (self.now - age, self.now - age))
+        os.symlink("big.log", os.path.join(self.root, "link.log"))
+        os.symlink("missing", os.path.join(self.root, "broken.log"))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def search(self, *args, **kwargs):
+        found = shell.search_entries(self.root, *args, **kwargs)
+        return sorted(
+            os.path.relpath(entry.path, self.root) for entry in found
+        )
+
+    def test_entries(self):
+        entries = list(shell.search_entries(self.root, "notes.txt"))
+        self.assertEqual(len(entries), 1)
+        self.assertIsInstance(entries[0], os.DirEntry)
+        self.assertEqual(entries[0].stat().st_size, 500)
+
+    def test_type(self):
+        self.assertEqual(self.search(type="dir"), ["old"])
+        self.assertEqual(self.search(type="link"), ["broken.log", "link.log"])
+        self.assertEqual(
+            self.search("*.log", type="file"),
+            ["big.log", "link.log", "old/big.log", "small.log"],
+        )
+        os.mkfifo(os.path.join(self.root, "fifo.log"))
+        self.assertNotIn("fifo.log", self.search(type="file"))
+        self.assertIn("fifo.log", self.search())
+        with self.assertRaises(ValueError):
+            self.search(type="socket")
+
+    def test_size(self):
+        self.assertEqual(
+            self.search(type="file", min_size=1000),
+            ["big.log", "link.log", "old/big.log"],
+        )
+        self.assertEqual(
+            self.search("*.log", min_size=100, max_size=1500),
+            ["big.log", "link.log"],
+        )
+
+    def test_time(self):
+        self.assertEqual(
+            self.search(type="file", older_than=self.now - 60),
+            ["old/big.log", "old/notes.txt"],
+        )
+        self.assertEqual(
+            self.search(
+                "*.txt",
+                newer_than=datetime.datetime.fromtimestamp(self.now - 7200),
+            ),
+            ["old/notes.txt"],
+        )
+
+    def test_callable_matcher(self):
+        self.assertEqual(
+            self.search(lambda name: name.startswith("b"), min_size=1000),
+            ["big.log", "old/big.log"],
+        )